@@ -0,0 +1,59 @@
+import argparse
+import json
+import time
+
+from sample_test import build_payload, get_codec
+
+
+def old_path(payload, resp_bytes):
+    # what post_one used to do: aiohttp json= (json.dumps -> str -> bytes),
+    # resp.text() (bytes -> str), then json.loads(str)
+    body = json.dumps(payload).encode("utf-8")
+    text = resp_bytes.decode("utf-8")
+    return body, json.loads(text)
+
+
+def new_path(codec, payload, resp_bytes):
+    return codec.dumps(payload), codec.loads(resp_bytes)
+
+
+def cpu_us_per_row(fn, n: int) -> float:
+    t0 = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - t0) / n * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser(description="Per-row JSON encode/decode CPU cost of the bulk poster")
+    p.add_argument("--rows", type=int, default=200000, help="Iterations per codec")
+    p.add_argument("--note-chars", type=int, default=400, help="NoteText length")
+    p.add_argument("--rate", type=int, default=10000, help="Target rows/s to express CPU share at")
+    args = p.parse_args()
+
+    row = {
+        "ExternalMemberID": "M0012345678",
+        "VisibleID": "ADMIN_NOTE_01",
+        "NoteText": ("Member called about prior auth status. " * 20)[: args.note_chars],
+    }
+    payload = build_payload(row)
+    resp_bytes = json.dumps({"data": {"M0012345678": ["987654321"]}, "success": True}).encode("utf-8")
+
+    results = [("stdlib (old: json= + text() + loads)", cpu_us_per_row(lambda: old_path(payload, resp_bytes), args.rows))]
+    for name in ("json", "orjson", "msgspec"):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print(f"{name:<38} not installed, skipped")
+            continue
+        results.append((f"{codec.name} (bytes in/out)", cpu_us_per_row(lambda: new_path(codec, payload, resp_bytes), args.rows)))
+
+    base = results[0][1]
+    print(f"{'codec':<38} {'us/row':>8} {'CPU @ %d rows/s' % args.rate:>18} {'saved':>8}")
+    for name, us in results:
+        cpu = us * args.rate / 1e6 * 100
+        print(f"{name:<38} {us:8.2f} {cpu:17.1f}% {(base - us) / base * 100:7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
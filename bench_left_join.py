@@ -0,0 +1,174 @@
+import argparse
+import csv
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def generate_inputs(workdir: str, rows: int, seed: int = 1) -> Dict[str, str]:
+    """
+    The three sheets LeftJoinSheetsOnName reads, as csv:
+      one:   Id, Name
+      two:   Age, Address, Name, Sample   (keyed on Name, col 3)
+      three: Name, Sample                  (keyed on Name, col 1)
+    Lookups hold about 70% of the left names, with some repeats to exercise
+    first-match-wins.
+    """
+    rnd = random.Random(seed)
+    paths = {name: os.path.join(workdir, f"{name}_{rows}.csv") for name in ("one", "two", "three")}
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+    with open(paths["one"], "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Id", "Name"])
+        for i in range(rows):
+            w.writerow([i, f" Name{rnd.randrange(rows):08d} "])
+    with open(paths["two"], "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Age", "Address", "Name", "Sample"])
+        for i in range(rows):
+            w.writerow([rnd.randrange(18, 90), f"{i} Main Street", f"Name{rnd.randrange(rows):08d}", f"S{i}"])
+    with open(paths["three"], "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Name", "Sample"])
+        for i in range(rows):
+            w.writerow([f"Name{rnd.randrange(rows):08d}", f"T{i}"])
+    return paths
+
+
+def load_sheet(wb, title: str, path: str):
+    ws = wb.create_sheet(title)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            ws.append(row)
+    return ws
+
+
+def macro_join(one: str, two: str, three: str, out: str) -> None:
+    """
+    The VBA macro transcribed onto openpyxl: sheets fully loaded into a
+    workbook, every value read with ws.cell(i, c) and written cell by cell
+    into a JoinedData sheet, then the workbook saved.
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook()
+    ws1, ws2, ws3 = load_sheet(wb, "one", one), load_sheet(wb, "two", two), load_sheet(wb, "three", three)
+    ws_out = wb.create_sheet("JoinedData")
+
+    d = {}
+    for i in range(2, ws2.max_row + 1):
+        key = str(ws2.cell(i, 3).value or "").strip()
+        if key and key not in d:
+            d[key] = [ws2.cell(i, 1).value, ws2.cell(i, 2).value, ws2.cell(i, 4).value]
+    d2 = {}
+    for i in range(2, ws3.max_row + 1):
+        key = str(ws3.cell(i, 1).value or "").strip()
+        if key and key not in d2:
+            d2[key] = [ws3.cell(i, 2).value]
+
+    for c, h in enumerate(["Id", "Name", "Age", "Sample", "Address"], start=1):
+        ws_out.cell(1, c).value = h
+    out_row = 2
+    for i in range(2, ws1.max_row + 1):
+        key = str(ws1.cell(i, 2).value or "").strip()
+        ws_out.cell(out_row, 1).value = str(ws1.cell(i, 1).value or "").strip()
+        ws_out.cell(out_row, 2).value = key
+        if key in d:
+            ws_out.cell(out_row, 3).value = d[key][0]
+            ws_out.cell(out_row, 4).value = d[key][1]
+        if key in d2:
+            ws_out.cell(out_row, 5).value = d2[key][0]
+        out_row += 1
+    wb.save(out)
+
+
+def run_child(name: str, cmd: List[str]) -> Dict[str, Any]:
+    """Run one mode in a child process; wall time, CPU and peak RSS from wait4."""
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.time() - t0
+    result: Dict[str, Any] = {
+        "mode": name,
+        "cmd": " ".join(shlex.quote(c) for c in cmd),
+        "exit": os.waitstatus_to_exitcode(status),
+        "wall_s": round(wall, 2),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 2),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+    if result["exit"] != 0:
+        result["output"] = out.decode("utf-8", "replace")[-2000:]
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description="left_join.py vs the macro's row-by-row join")
+    p.add_argument("--rows", type=int, nargs="+", default=[1000000], help="Rows per input sheet")
+    p.add_argument("--modes", nargs="+", default=["macro", "memory", "spill", "memory-xlsx"],
+                   help="macro | memory | spill | memory-xlsx")
+    p.add_argument("--spill-memory-rows", type=int, default=None,
+                   help="--memory-rows for the spill mode (default: rows/4)")
+    p.add_argument("--workdir", default=None, help="Keep inputs/outputs here (default: temp dir)")
+    p.add_argument("--report", default=None, help="Write all results as JSON")
+    p.add_argument("--macro-child", nargs=4, default=None, help=argparse.SUPPRESS)
+    args = p.parse_args()
+
+    if args.macro_child:
+        macro_join(*args.macro_child)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_left_join_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for n in args.rows:
+        print(f"generating {n} rows x 3 inputs in {workdir}")
+        paths = generate_inputs(workdir, n)
+        common = [
+            "--left", paths["one"], "1", "Id,Name",
+            "--join", paths["two"], "2", "Age,Sample",
+            "--join", paths["three"], "0", "Sample",
+        ]
+        modes = {
+            "macro": [sys.executable, os.path.abspath(__file__), "--macro-child",
+                      paths["one"], paths["two"], paths["three"], os.path.join(workdir, f"macro_{n}.xlsx")],
+            "memory": [sys.executable, os.path.join(HERE, "left_join.py")] + common
+                      + ["--out", os.path.join(workdir, f"memory_{n}.csv")],
+            "spill": [sys.executable, os.path.join(HERE, "left_join.py")] + common
+                     + ["--out", os.path.join(workdir, f"spill_{n}.csv"),
+                        "--memory-rows", str(args.spill_memory_rows or max(n // 4, 1)), "--tmpdir", workdir],
+            "memory-xlsx": [sys.executable, os.path.join(HERE, "left_join.py")] + common
+                           + ["--out", os.path.join(workdir, f"memory_{n}.xlsx")],
+        }
+        print(f"\n{n} rows")
+        print(f"{'mode':<12} {'wall s':>8} {'cpu s':>8} {'RSS MB':>8} {'rows/s':>10}")
+        for mode in args.modes:
+            if mode not in modes:
+                p.error(f"unknown mode {mode}")
+            res = run_child(mode, modes[mode])
+            res["rows"] = n
+            results.append(res)
+            if res["exit"] != 0:
+                print(f"{mode:<12} FAILED (exit {res['exit']})\n{res['output']}")
+                continue
+            print(f"{mode:<12} {res['wall_s']:>8} {res['cpu_s']:>8} {res['peak_rss_mb']:>8} "
+                  f"{round(n / res['wall_s']) if res['wall_s'] else 0:>10}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print("\nreport:", args.report)
+    print("workdir:", workdir)
+
+
+if __name__ == "__main__":
+    main()
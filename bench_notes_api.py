@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+
+# name -> extra sample_test.py flags; every mode also gets --input/--url/outputs
+MODES = {
+    "baseline": [],
+    "stream": ["--stream"],
+    "stream-batch50": ["--stream", "--batch-size", "50"],
+    "adaptive": ["--stream", "--adaptive"],
+    "workers4": ["--workers", "4"],
+}
+
+
+def make_app(
+    latency_ms: float = 20.0,
+    latency_sigma: float = 0.5,
+    error_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    retry_after_s: float = 0.0,
+    false_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> web.Application:
+    """
+    Fake notes API shaped like the real one:
+      POST /notes {"notes": [{"memberId": ...}, ...]}
+        -> {"success": true, "data": {"<memberId>": ["<id>", ...]}}
+    Latency is lognormal with median latency_ms (sigma=0 -> fixed).
+    error_rate -> 500, throttle_rate -> 429 (+ Retry-After), false_rate ->
+    200 with success=false and no ids. Counters at GET /stats.
+    """
+    rnd = random.Random(seed)
+    mu = math.log(max(latency_ms, 0.001) / 1000)
+    stats = {"requests": 0, "notes": 0, "500": 0, "429": 0, "success_false": 0}
+    next_id = [1]
+
+    async def notes(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        body = await request.json()
+        await asyncio.sleep(rnd.lognormvariate(mu, latency_sigma) if latency_sigma else math.exp(mu))
+
+        r = rnd.random()
+        if r < error_rate:
+            stats["500"] += 1
+            return web.json_response({"success": False, "message": "internal error"}, status=500)
+        if r < error_rate + throttle_rate:
+            stats["429"] += 1
+            headers = {"Retry-After": f"{retry_after_s:g}"} if retry_after_s else None
+            return web.json_response({"success": False, "message": "too many requests"}, status=429, headers=headers)
+        if r < error_rate + throttle_rate + false_rate:
+            stats["success_false"] += 1
+            return web.json_response({"success": False, "data": {}, "message": "note definition not found"})
+
+        data: Dict[str, List[str]] = {}
+        for note in body.get("notes", []):
+            data.setdefault(note.get("memberId", ""), []).append(str(next_id[0]))
+            next_id[0] += 1
+        stats["notes"] += len(body.get("notes", []))
+        return web.json_response({"success": True, "data": data})
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/notes", notes)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def _serve(port: int, app_kwargs: Dict[str, Any]) -> None:
+    web.run_app(make_app(**app_kwargs), host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def start_fake_api(port: int, **app_kwargs) -> multiprocessing.Process:
+    """
+    Run the fake API in its own process so it doesn't compete with the
+    client under test for the GIL / event loop. Returns once it accepts.
+    """
+    proc = multiprocessing.get_context("spawn").Process(target=_serve, args=(port, app_kwargs), daemon=True)
+    proc.start()
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"fake notes API did not start on port {port}")
+
+
+def generate_csv(path: str, rows: int, visible_ids: int = 5, note_chars: int = 200,
+                 dup_rate: float = 0.0, seed: int = 1) -> None:
+    """Synthetic input with sample_test.py's columns (ExternalMemberID, VisibleID, NoteText)."""
+    rnd = random.Random(seed)
+    filler = "Member called regarding authorization status and follow-up. "
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["ExternalMemberID", "VisibleID", "NoteText"])
+        for i in range(rows):
+            if dup_rate and i and rnd.random() < dup_rate:
+                j = rnd.randrange(i)  # repeat an earlier row exactly
+            else:
+                j = i
+            text = (f"#{j} " + filler * (note_chars // len(filler) + 1))[:note_chars]
+            w.writerow([f"M{j:010d}", f"NOTEDEF_{j % visible_ids}", text])
+
+
+def run_mode(name: str, extra: List[str], input_csv: str, url: str, workdir: str,
+             concurrency: int, common: List[str]) -> Dict[str, Any]:
+    """Run sample_test.py once in a child process; wall time, peak RSS and latency percentiles."""
+    metrics_json = os.path.join(workdir, f"{name}.metrics.json")
+    cmd = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_test.py"),
+        "--input", input_csv, "--url", url,
+        "--concurrency", str(concurrency),
+        "--out-success", os.path.join(workdir, f"{name}.success.csv"),
+        "--out-failed", os.path.join(workdir, f"{name}.failed.csv"),
+        "--out-duplicates", os.path.join(workdir, f"{name}.duplicates.csv"),
+        "--metrics-json", metrics_json,
+        "--print-every", "100000000",
+    ] + common + extra
+
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    out = proc.stdout.read()
+    # wait4 gives this child's rusage (ru_maxrss in KiB on Linux). CPU time
+    # includes reaped --workers shards; RSS is the largest single process,
+    # not the sum across shards.
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.time() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    result: Dict[str, Any] = {
+        "mode": name,
+        "cmd": " ".join(shlex.quote(c) for c in cmd),
+        "exit": proc.returncode,
+        "wall_s": round(wall, 3),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+    }
+    if proc.returncode != 0:
+        result["output"] = out.decode("utf-8", "replace")[-2000:]
+        return result
+
+    with open(metrics_json, encoding="utf-8") as f:
+        m = json.load(f)
+    rows = sum(m["results"].values())
+    result.update({
+        "rows": rows,
+        "ok": m["results"].get("ok", 0),
+        "rows_per_s": round(rows / wall, 1) if wall else 0,
+        "requests": m["latency"]["total"]["count"],
+        "p50_ms": m["latency"]["total"]["p50_ms"],
+        "p95_ms": m["latency"]["total"]["p95_ms"],
+        "p99_ms": m["latency"]["total"]["p99_ms"],
+    })
+    return result
+
+
+def main():
+    p = argparse.ArgumentParser(description="Throughput benchmark for sample_test.py against a local fake notes API")
+    p.add_argument("--rows", type=int, nargs="+", default=[10000], help="Input sizes to generate (e.g. 10000 1000000)")
+    p.add_argument("--modes", nargs="+", default=list(MODES), help=f"Subset of: {', '.join(MODES)}")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--port", type=int, default=18080)
+    p.add_argument("--latency-ms", type=float, default=20.0, help="Median server latency")
+    p.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal sigma (0 = fixed latency)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 responses")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="Share of HTTP 429 responses")
+    p.add_argument("--retry-after", type=float, default=0.0, help="Retry-After seconds sent with 429")
+    p.add_argument("--false-rate", type=float, default=0.0, help="Share of 200 success=false responses")
+    p.add_argument("--dup-rate", type=float, default=0.0, help="Share of duplicated rows in generated input")
+    p.add_argument("--extra", default="", help="Extra sample_test.py flags for every mode, e.g. \"--retries 3\"")
+    p.add_argument("--workdir", default=None, help="Keep inputs/outputs here (default: temp dir)")
+    p.add_argument("--report", default=None, help="Write all results as JSON")
+    args = p.parse_args()
+
+    unknown = [m for m in args.modes if m not in MODES]
+    if unknown:
+        p.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_notes_api_")
+    os.makedirs(workdir, exist_ok=True)
+
+    server = start_fake_api(
+        args.port,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after_s=args.retry_after,
+        false_rate=args.false_rate,
+    )
+    url = f"http://127.0.0.1:{args.port}/notes"
+    results = []
+    try:
+        for n in args.rows:
+            input_csv = os.path.join(workdir, f"input_{n}.csv")
+            if not os.path.exists(input_csv):
+                print(f"generating {n} rows -> {input_csv}")
+                generate_csv(input_csv, n, dup_rate=args.dup_rate)
+            print(f"\n{n} rows | median latency {args.latency_ms}ms | concurrency {args.concurrency}")
+            print(f"{'mode':<16} {'rows/s':>9} {'wall s':>8} {'cpu s':>7} {'RSS MB':>7} "
+                  f"{'reqs':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'ok':>8}")
+            for mode in args.modes:
+                res = run_mode(mode, MODES[mode], input_csv, url, workdir, args.concurrency, shlex.split(args.extra))
+                res["input_rows"] = n
+                results.append(res)
+                if res["exit"] != 0:
+                    print(f"{mode:<16} FAILED (exit {res['exit']})\n{res['output']}")
+                    continue
+                print(f"{mode:<16} {res['rows_per_s']:>9} {res['wall_s']:>8} {res['cpu_s']:>7} {res['peak_rss_mb']:>7} "
+                      f"{res['requests']:>8} {res['p50_ms']:>7} {res['p95_ms']:>7} {res['p99_ms']:>7} {res['ok']:>8}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print("\nreport:", args.report)
+    print("workdir:", workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import shlex
+import socket
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from bench_notes_api import generate_csv, run_mode
+
+# sample_test.py --transport comparison. The aiohttp fake API in
+# bench_notes_api.py only speaks HTTP/1.1, so this one is a bare ASGI app
+# under hypercorn, which serves HTTP/1.1 and h2c (prior knowledge) on the
+# same port: every mode talks to the same server.
+
+# warm-up is capped at the pool size, so 1000 means one connection per --concurrency slot
+WARM = ["--warm-up", "1000", "--warm-up-url", "/health"]
+MODES = {
+    # the pre-transport defaults: aiohttp's 10s DNS cache and 15s keep-alive
+    "aiohttp-cold": ["--transport", "aiohttp", "--dns-ttl", "10", "--keepalive", "15"],
+    "aiohttp": ["--transport", "aiohttp"] + WARM,
+    "http2-cold": ["--transport", "http2"],
+    "http2": ["--transport", "http2"] + WARM,
+}
+
+
+def make_asgi_app(latency_ms: float = 20.0, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                  seed: Optional[int] = None):
+    """
+    POST /notes like bench_notes_api.make_app (lognormal latency, error_rate
+    -> 500), GET /health (the --warm-up-url target); anything else 405.
+    """
+    rnd = random.Random(seed)
+    mu = math.log(max(latency_ms, 0.001) / 1000)
+    next_id = [1]
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                msg = await receive()
+                if msg["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif msg["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        chunks = []
+        while True:
+            msg = await receive()
+            if msg["type"] == "http.disconnect":
+                # stream reset by the client (httpcore retries those on another connection)
+                return
+            chunks.append(msg.get("body", b""))
+            if not msg.get("more_body"):
+                break
+
+        if scope["method"] == "GET" and scope["path"] == "/health":
+            status, out = 200, {"status": "ok"}
+        elif scope["method"] != "POST" or scope["path"] != "/notes":
+            status, out = 405, {"success": False, "message": "method not allowed"}
+        else:
+            body = json.loads(b"".join(chunks))
+            await asyncio.sleep(rnd.lognormvariate(mu, latency_sigma) if latency_sigma else math.exp(mu))
+            if rnd.random() < error_rate:
+                status, out = 500, {"success": False, "message": "internal error"}
+            else:
+                data: Dict[str, List[str]] = {}
+                for note in body.get("notes", []):
+                    data.setdefault(note.get("memberId", ""), []).append(str(next_id[0]))
+                    next_id[0] += 1
+                status, out = 200, {"success": True, "data": data}
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps(out).encode("utf-8")})
+
+    return app
+
+
+def _serve(port: int, app_kwargs: Dict[str, Any]) -> None:
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.accesslog = None
+    config.keep_alive_timeout = 120
+    # hypercorn (like nginx) sends GOAWAY after 1000 requests per connection; h2 streams
+    # still in flight on it then fail and go through --retries. Off here, so the modes
+    # compare transports rather than reconnect handling
+    config.keep_alive_max_requests = 10 ** 9
+    asyncio.run(serve(make_asgi_app(**app_kwargs), config))
+
+
+def start_h2c_api(port: int, **app_kwargs) -> multiprocessing.Process:
+    """Like bench_notes_api.start_fake_api, with the hypercorn server."""
+    proc = multiprocessing.get_context("spawn").Process(target=_serve, args=(port, app_kwargs), daemon=True)
+    proc.start()
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"hypercorn notes API did not start on port {port}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="sample_test.py --transport aiohttp vs http2 against a local HTTP/1.1 + h2c server")
+    p.add_argument("--rows", type=int, nargs="+", default=[10000], help="Input sizes to generate")
+    p.add_argument("--modes", nargs="+", default=list(MODES), help=f"Subset of: {', '.join(MODES)}")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--port", type=int, default=18090)
+    p.add_argument("--latency-ms", type=float, default=20.0, help="Median server latency")
+    p.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal sigma (0 = fixed latency)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of HTTP 500 responses")
+    p.add_argument("--extra", default="", help="Extra sample_test.py flags for every mode, e.g. \"--stream\"")
+    p.add_argument("--workdir", default=None, help="Keep inputs/outputs here (default: temp dir)")
+    p.add_argument("--report", default=None, help="Write all results as JSON")
+    args = p.parse_args()
+
+    unknown = [m for m in args.modes if m not in MODES]
+    if unknown:
+        p.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_transport_")
+    os.makedirs(workdir, exist_ok=True)
+    server = start_h2c_api(args.port, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                           error_rate=args.error_rate)
+    url = f"http://127.0.0.1:{args.port}/notes"
+    results = []
+    try:
+        for n in args.rows:
+            input_csv = os.path.join(workdir, f"input_{n}.csv")
+            if not os.path.exists(input_csv):
+                print(f"generating {n} rows -> {input_csv}")
+                generate_csv(input_csv, n)
+            print(f"\n{n} rows | median latency {args.latency_ms}ms | concurrency {args.concurrency}")
+            print(f"{'mode':<14} {'rows/s':>9} {'wall s':>8} {'cpu s':>7} {'RSS MB':>7} "
+                  f"{'conns':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'ok':>8}")
+            for mode in args.modes:
+                res = run_mode(mode, MODES[mode], input_csv, url, workdir, args.concurrency, shlex.split(args.extra))
+                res["input_rows"] = n
+                results.append(res)
+                if res["exit"] != 0:
+                    print(f"{mode:<14} FAILED (exit {res['exit']})\n{res['output']}")
+                    continue
+                # connections opened while rows were being sent (warm-up ones aren't timed)
+                with open(os.path.join(workdir, f"{mode}.metrics.json"), encoding="utf-8") as f:
+                    res["connections"] = json.load(f)["latency"]["connect"]["count"]
+                print(f"{mode:<14} {res['rows_per_s']:>9} {res['wall_s']:>8} {res['cpu_s']:>7} {res['peak_rss_mb']:>7} "
+                      f"{res['connections']:>6} {res['p50_ms']:>7} {res['p95_ms']:>7} {res['p99_ms']:>7} {res['ok']:>8}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print("\nreport:", args.report)
+    print("workdir:", workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import argparse
+import csv
+import heapq
+import os
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from medicaid_matcher import RowWriter, iter_sheet_rows, resolve_col
+
+# N-way version of the LeftJoinSheetsOnName macro (excel.txt): every row of
+# the left input is kept, each --join input contributes its selected columns
+# for the first row with the same trimmed key (later duplicates are ignored,
+# like the macro's `If Not dict.exists`). Lookups are plain dicts while they
+# fit in --memory-rows; past that everything is hash-partitioned to disk,
+# joined one partition at a time and merged back into left-input order.
+
+WRITE_CHUNK = 10000
+
+
+class JoinSide:
+    """One input: PATH[#sheet], key column and the columns it contributes."""
+
+    def __init__(self, spec: List[str], default_all: bool):
+        if not 2 <= len(spec) <= 3:
+            raise SystemExit(f"expected PATH KEY [COLS], got {spec}")
+        path, _, sheet = spec[0].partition("#")
+        self.path = path
+        self.sheet = sheet or None
+        self.key_col = spec[1]
+        self.cols_spec = spec[2].split(",") if len(spec) == 3 else None
+        self.default_all = default_all
+        self.header: List[str] = []
+        self.key_idx = 0
+        self.col_idx: List[int] = []
+
+    def open(self) -> Iterator[List[str]]:
+        """Data rows; resolves key/column indexes from the header first."""
+        rows = iter_sheet_rows(self.path, self.sheet)
+        header = next(rows, [])
+        self.key_idx = resolve_col(header, self.key_col)
+        if self.cols_spec:
+            self.col_idx = [resolve_col(header, c) for c in self.cols_spec]
+        elif self.default_all:
+            self.col_idx = list(range(len(header)))
+        else:
+            self.col_idx = [i for i in range(len(header)) if i != self.key_idx]
+        self.header = [header[i] if i < len(header) else f"col{i}" for i in self.col_idx]
+        return rows
+
+    def key(self, row: List[str], key_fn: Callable[[str], str]) -> str:
+        return key_fn(row[self.key_idx]) if self.key_idx < len(row) else ""
+
+    def pick(self, row: List[str]) -> List[str]:
+        n = len(row)
+        return [row[i] if i < n else "" for i in self.col_idx]
+
+
+class Partitions:
+    """P csv spill files for one input; row i goes to hash(key) % P."""
+
+    def __init__(self, tmpdir: str, name: str, n: int):
+        self.paths = [os.path.join(tmpdir, f"{name}.{i}.csv") for i in range(n)]
+        self._files = [open(p, "w", newline="", encoding="utf-8") for p in self.paths]
+        self._writers = [csv.writer(f) for f in self._files]
+        self.n = n
+
+    def add(self, key: str, row: List[str]) -> None:
+        self._writers[hash(key) % self.n].writerow(row)
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+
+    @staticmethod
+    def read(path: str) -> Iterator[List[str]]:
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            yield from csv.reader(f)
+
+
+class LeftJoin:
+    def __init__(self, left: JoinSide, joins: List[JoinSide], key_fn: Callable[[str], str],
+                 memory_rows: int, partitions: int, tmpdir: Optional[str] = None):
+        self.left = left
+        self.joins = joins
+        self.key_fn = key_fn
+        self.memory_rows = memory_rows
+        self.partitions = partitions
+        self.tmpdir = tmpdir
+        self.stats: Dict[str, int] = {"left_rows": 0, "build_rows": 0}
+        self.mode = "memory"
+        # open() resolves headers, so the output header is known up front
+        self._streams = [j.open() for j in joins]
+        self._left_rows = left.open()
+
+    def header(self) -> List[str]:
+        return self.left.header + [h for j in self.joins for h in j.header]
+
+    def run(self, writer: RowWriter) -> Dict[str, int]:
+        """Join everything into writer (opened with header()); returns row/match counters."""
+        streams, left_rows = self._streams, self._left_rows
+        lookups: List[Dict[str, Tuple[str, ...]]] = []
+        used = 0
+        for j, (side, rows) in enumerate(zip(self.joins, streams)):
+            d: Dict[str, Tuple[str, ...]] = {}
+            lookups.append(d)
+            for row in rows:
+                k = side.key(row, self.key_fn)
+                if k and k not in d:
+                    d[k] = tuple(side.pick(row))
+                    used += 1
+                    if used > self.memory_rows:
+                        return self._run_spilled(writer, lookups, j, streams, left_rows)
+        self.stats["build_rows"] = used
+        self._probe(left_rows, lookups, writer)
+        return self.stats
+
+    def _probe(self, left_rows: Iterator[List[str]], lookups, writer: RowWriter) -> None:
+        empties = [("",) * len(j.col_idx) for j in self.joins]
+        matched = [0] * len(self.joins)
+        chunk: List[List[str]] = []
+        left, key_fn = self.left, self.key_fn
+        for row in left_rows:
+            if not any(row):
+                continue
+            k = left.key(row, key_fn)
+            out = left.pick(row)
+            for j, d in enumerate(lookups):
+                hit = d.get(k) if k else None
+                if hit is None:
+                    out.extend(empties[j])
+                else:
+                    matched[j] += 1
+                    out.extend(hit)
+            chunk.append(out)
+            if len(chunk) >= WRITE_CHUNK:
+                writer.write_many(chunk)
+                chunk = []
+        if chunk:
+            writer.write_many(chunk)
+        self.stats["left_rows"] = writer.count
+        for j, m in enumerate(matched):
+            self.stats[f"matched_{j + 1}"] = m
+
+    def _run_spilled(self, writer: RowWriter, lookups, spill_at: int, streams, left_rows) -> Dict[str, int]:
+        """
+        Grace hash join. Build inputs are partitioned by key hash; what was
+        already in memory goes out first, so the first occurrence of a key
+        still comes first in its partition and first-match-wins holds. Left
+        rows are partitioned with their row number, each partition is joined
+        in memory, and the per-partition outputs (each already in row order)
+        are k-way merged back into left-input order.
+        """
+        self.mode = "spill"
+        n = self.partitions
+        key_fn = self.key_fn
+        with tempfile.TemporaryDirectory(prefix="left_join_", dir=self.tmpdir) as tmp:
+            build_parts = []
+            for j, side in enumerate(self.joins):
+                parts = Partitions(tmp, f"build{j}", n)
+                build_parts.append(parts)
+                if j <= spill_at:
+                    for k, vals in lookups[j].items():
+                        parts.add(k, [k, *vals])
+                    lookups[j].clear()
+                if j >= spill_at:
+                    for row in streams[j]:
+                        k = side.key(row, key_fn)
+                        if k:
+                            parts.add(k, [k, *side.pick(row)])
+                parts.close()
+
+            left_parts = Partitions(tmp, "left", n)
+            rowno = 0
+            for row in left_rows:
+                if not any(row):
+                    continue
+                # rows with an empty key can't match; any partition will do
+                k = self.left.key(row, key_fn)
+                left_parts.add(k, [str(rowno), k, *self.left.pick(row)])
+                rowno += 1
+            left_parts.close()
+
+            empties = [[""] * len(j.col_idx) for j in self.joins]
+            matched = [0] * len(self.joins)
+            joined_paths = []
+            build_rows = 0
+            for p in range(n):
+                part_lookups = []
+                for parts in build_parts:
+                    d: Dict[str, List[str]] = {}
+                    for row in Partitions.read(parts.paths[p]):
+                        if row[0] not in d:
+                            d[row[0]] = row[1:]
+                    build_rows += len(d)
+                    part_lookups.append(d)
+                out_path = os.path.join(tmp, f"joined.{p}.csv")
+                joined_paths.append(out_path)
+                with open(out_path, "w", newline="", encoding="utf-8") as f:
+                    w = csv.writer(f)
+                    for row in Partitions.read(left_parts.paths[p]):
+                        k = row[1]
+                        out = [row[0], *row[2:]]
+                        for j, d in enumerate(part_lookups):
+                            hit = d.get(k) if k else None
+                            if hit is None:
+                                out.extend(empties[j])
+                            else:
+                                matched[j] += 1
+                                out.extend(hit)
+                        w.writerow(out)
+
+            merged = heapq.merge(*(Partitions.read(path) for path in joined_paths), key=lambda r: int(r[0]))
+            chunk: List[List[str]] = []
+            for row in merged:
+                chunk.append(row[1:])
+                if len(chunk) >= WRITE_CHUNK:
+                    writer.write_many(chunk)
+                    chunk = []
+            if chunk:
+                writer.write_many(chunk)
+
+        self.stats["left_rows"] = writer.count
+        self.stats["build_rows"] = build_rows
+        for j, m in enumerate(matched):
+            self.stats[f"matched_{j + 1}"] = m
+        return self.stats
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Left-join N csv/xlsx inputs on a trimmed key (first match wins), "
+                    "in memory or spilled to disk. Inputs are PATH[#sheet] KEY [COLS]; "
+                    "KEY/COLS are 0-based indexes or header names, COLS comma-separated.",
+    )
+    p.add_argument("--left", nargs="+", required=True, metavar="ARG",
+                   help="Left input: PATH KEY [COLS] (default: all columns)")
+    p.add_argument("--join", nargs="+", action="append", required=True, metavar="ARG",
+                   help="Lookup input, repeatable: PATH KEY [COLS] (default: all but the key)")
+    p.add_argument("--out", default="joined.csv", help="Output (.csv or .xlsx)")
+    p.add_argument("--ignore-case", action="store_true", help="Compare keys case-insensitively")
+    p.add_argument("--memory-rows", type=int, default=5_000_000,
+                   help="Distinct lookup keys (all --join inputs together) kept in memory before spilling to disk")
+    p.add_argument("--partitions", type=int, default=64, help="Spill partitions")
+    p.add_argument("--tmpdir", default=None, help="Directory for spill files (default: system temp)")
+    args = p.parse_args()
+
+    key_fn = (lambda v: v.strip().upper()) if args.ignore_case else str.strip
+    engine = LeftJoin(
+        JoinSide(args.left, default_all=True),
+        [JoinSide(spec, default_all=False) for spec in args.join],
+        key_fn, args.memory_rows, max(args.partitions, 1), args.tmpdir,
+    )
+
+    started = time.time()
+    writer = RowWriter(args.out, engine.header(), "JoinedData")
+    try:
+        stats = engine.run(writer)
+    finally:
+        writer.close()
+
+    print(f"mode={engine.mode} " + " ".join(f"{k}={v}" for k, v in stats.items())
+          + f" time={time.time() - started:.1f}s")
+    print("output:", args.out)
+
+
+if __name__ == "__main__":
+    main()
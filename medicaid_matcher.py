@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import csv
+import datetime
+import os
+import time
+from typing import Any, Iterator, List, Optional, Set, Tuple, Union
+
+# Python version of the MedicaidMatcher (Excel) / CsvReaderUtil (csv) Java:
+# keep the rows of the records file whose medicaid id appears in the ids
+# file. Both files are streamed (openpyxl read-only for .xlsx), only the
+# id set is held in memory.
+
+Key = Union[int, str]
+
+
+def format_cell(v: Any) -> str:
+    """Cell value as displayed text, like POI's DataFormatter (12345.0 -> "12345")."""
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    if isinstance(v, datetime.datetime):
+        return v.date().isoformat() if v.time() == datetime.time() else v.isoformat(sep=" ")
+    if isinstance(v, datetime.date):
+        return v.isoformat()
+    return str(v)
+
+
+def normalize_id(value: str) -> Optional[Key]:
+    """
+    Trimmed, upper-cased medicaid id. Plain numbers without a leading zero
+    become ints - a fraction of the memory of a str in the key set - while
+    "00123" stays a str so it never collides with "123".
+    """
+    v = value.strip().upper()
+    if not v:
+        return None
+    if v.isascii() and v.isdigit() and v[0] != "0" and len(v) <= 18:
+        return int(v)
+    return v
+
+
+def iter_sheet_rows(path: str, sheet: Optional[str] = None) -> Iterator[List[str]]:
+    """Rows (header first) of a .xlsx sheet or a .csv file, as lists of strings."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        import openpyxl  # optional dependency, only for Excel inputs
+
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet] if sheet else wb.worksheets[0]
+            for row in ws.iter_rows(values_only=True):
+                yield [format_cell(v) for v in row]
+        finally:
+            wb.close()
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            yield from csv.reader(f)
+
+
+def estimate_rows(path: str, sheet: Optional[str] = None) -> int:
+    """Data rows in a records file, for progress only (xlsx: sheet dimension)."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            ws = wb[sheet] if sheet else wb.worksheets[0]
+            return max((ws.max_row or 1) - 1, 0)
+        finally:
+            wb.close()
+    from sample_test import count_rows_fast
+    return count_rows_fast(path)
+
+
+def resolve_col(header: List[str], col: str) -> int:
+    """Column by 0-based index ("0") or by header name (case/space-insensitive)."""
+    if col.isdigit():
+        return int(col)
+    wanted = col.strip().lower()
+    for i, name in enumerate(header):
+        if name.strip().lower() == wanted:
+            return i
+    raise SystemExit(f"column {col!r} not found in header {header}")
+
+
+def load_id_set(path: str, col: str = "0", sheet: Optional[str] = None) -> Set[Key]:
+    """Build side of the hash join: every normalized id in the ids file, built once."""
+    rows = iter_sheet_rows(path, sheet)
+    header = next(rows, [])
+    idx = resolve_col(header, col)
+    ids: Set[Key] = set()
+    for row in rows:
+        if idx < len(row):
+            key = normalize_id(row[idx])
+            if key is not None:
+                ids.add(key)
+    return ids
+
+
+def match_rows(path: str, ids: Set[Key], col: str = "0",
+               sheet: Optional[str] = None) -> Tuple[List[str], Iterator[Tuple[bool, List[str]]]]:
+    """Probe side: (header, stream of (matched, row)) over the records file."""
+    rows = iter_sheet_rows(path, sheet)
+    header = next(rows, [])
+    idx = resolve_col(header, col)
+
+    def probe() -> Iterator[Tuple[bool, List[str]]]:
+        for row in rows:
+            if not any(row):
+                continue
+            key = normalize_id(row[idx]) if idx < len(row) else None
+            yield key is not None and key in ids, row
+
+    return header, probe()
+
+
+class RowWriter:
+    """Streaming row writer: .xlsx via openpyxl write-only mode, csv otherwise."""
+
+    def __init__(self, path: str, header: List[str], sheet_title: str = "Matched"):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.count = 0
+        if path.lower().endswith(".xlsx"):
+            import openpyxl
+
+            self._wb = openpyxl.Workbook(write_only=True)
+            self._ws = self._wb.create_sheet(sheet_title)
+            self._f = None
+            self._ws.append(header)
+        else:
+            self._wb = None
+            self._f = open(path, "w", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._f)
+            self._csv.writerow(header)
+
+    def write(self, row: List[str]) -> None:
+        self.count += 1
+        if self._wb is not None:
+            self._ws.append(row)
+        else:
+            self._csv.writerow(row)
+
+    def write_many(self, rows: List[List[str]]) -> None:
+        self.count += len(rows)
+        if self._wb is not None:
+            for row in rows:
+                self._ws.append(row)
+        else:
+            self._csv.writerows(rows)
+
+    def close(self) -> None:
+        if self._wb is not None:
+            self._wb.save(self.path)
+        else:
+            self._f.close()
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Keep records whose medicaid id is in an ids file (xlsx/csv, streamed); "
+                    "optionally post matches as notes. Arguments after `--` go to sample_test.py.",
+    )
+    p.add_argument("--records", required=True, help="Records file (excel1 / CSV with medicaid_id, Auth name, note text)")
+    p.add_argument("--ids", required=True, help="Medicaid id list (excel2 / CSV)")
+    p.add_argument("--records-col", default="0", help="Medicaid id column in --records: index or header name")
+    p.add_argument("--ids-col", default="0", help="Medicaid id column in --ids: index or header name")
+    p.add_argument("--records-sheet", default=None, help="Sheet name in --records (xlsx; default first)")
+    p.add_argument("--ids-sheet", default=None, help="Sheet name in --ids (xlsx; default first)")
+    p.add_argument("--out-matched", default="matched.csv", help="Matched rows (.csv or .xlsx)")
+    p.add_argument("--out-unmatched", default=None, help="Also write non-matching rows here")
+    p.add_argument("--note-col", default="note text", help="Note text column, when posting")
+    p.add_argument("--visible-id", default=None, help="VisibleID (note definition) for every posted note")
+    p.add_argument("--visible-id-col", default=None, help="...or take VisibleID from this column")
+    p.add_argument("post_args", nargs=argparse.REMAINDER,
+                   help="-- --url URL [--token ... --concurrency ...]: post matched rows with sample_test.py")
+    args = p.parse_args()
+
+    post_argv = args.post_args[1:] if args.post_args[:1] == ["--"] else args.post_args
+    if post_argv and not (args.visible_id or args.visible_id_col):
+        p.error("posting needs --visible-id or --visible-id-col")
+
+    started = time.time()
+    ids = load_id_set(args.ids, args.ids_col, args.ids_sheet)
+    print(f"ids: {len(ids)} distinct from {args.ids} ({time.time() - started:.1f}s)")
+
+    header, probe = match_rows(args.records, ids, args.records_col, args.records_sheet)
+    id_idx = resolve_col(header, args.records_col)
+    matched = RowWriter(args.out_matched, header)
+    unmatched = RowWriter(args.out_unmatched, header, "Unmatched") if args.out_unmatched else None
+    scanned = 0
+
+    def matched_rows() -> Iterator[List[str]]:
+        nonlocal scanned
+        for ok, row in probe:
+            scanned += 1
+            if ok:
+                matched.write(row)
+                yield row
+            elif unmatched is not None:
+                unmatched.write(row)
+
+    try:
+        if post_argv:
+            import sample_test
+
+            note_idx = resolve_col(header, args.note_col)
+            vis_idx = resolve_col(header, args.visible_id_col) if args.visible_id_col else None
+
+            def note_rows():
+                for row in matched_rows():
+                    cell = lambda i: row[i] if i is not None and i < len(row) else ""
+                    yield {
+                        "ExternalMemberID": cell(id_idx).strip(),
+                        "VisibleID": args.visible_id or cell(vis_idx),
+                        "NoteText": cell(note_idx),
+                    }
+
+            st_args = sample_test.parse_args(["--input", args.records] + post_argv)
+            if st_args.workers > 1:
+                p.error("--workers isn't supported when posting from the matcher")
+            total = estimate_rows(args.records, args.records_sheet)
+            asyncio.run(sample_test.run_all(st_args, source=(note_rows(), total)))
+        else:
+            for _ in matched_rows():
+                pass
+    finally:
+        matched.close()
+        if unmatched is not None:
+            unmatched.close()
+
+    print(f"scanned={scanned} matched={matched.count} unmatched={scanned - matched.count} "
+          f"time={time.time() - started:.1f}s")
+    print("matched file:", args.out_matched)
+    if unmatched is not None:
+        print("unmatched file:", args.out_unmatched)
+
+
+if __name__ == "__main__":
+    main()
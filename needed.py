@@ -24,13 +24,69 @@ raise Exception('test')
 testDict:Dict[str,str] = {"a":"b","b":{}}
 print(testDict)
 '''
+import threading
+import time
 from lib.sample_file import f_method
 from typing import Tuple,Dict,List,TypedDict
+
+CREDENTIAL_TTL_S = 900.0
+
+
+class CredentialCache:
+    """Process-wide memo of f_method results keyed on (f_method, args), each kept ttl_s seconds."""
+
+    def __init__(self, ttl_s: float):
+        self.ttl_s = ttl_s
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, fn, *args):
+        key = (fn, args)
+        hit = self._values.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # one lookup per secret even when many threads ask at once
+        with key_lock:
+            hit = self._values.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                return hit[1]
+            value = fn(*args)
+            self._values[key] = (time.monotonic() + self.ttl_s, value)
+            return value
+
+    def invalidate(self, *args):
+        """Forget the secret for these f_method args (e.g. after a rotation); everything if none given."""
+        with self._lock:
+            if not args:
+                self._values.clear()
+                self._key_locks.clear()
+                return
+            for key in [k for k in self._values if k[1] == args]:
+                del self._values[key]
+
+
+credential_cache = CredentialCache(CREDENTIAL_TTL_S)
+
+
 class SetParameters:
     def __init__(self,test):
         self.hai = "hai"
-        self.passwd = f_method("a","b",test)
-        self.passwd2 = f_method("a", "b", "ccc")
+        # passwords are looked up on first access, through credential_cache;
+        # f_method is taken now so a patch active at construction still applies
+        self._f_method = f_method
+        self._passwd_args = ("a", "b", test)
+        self._passwd2_args = ("a", "b", "ccc")
+
+    @property
+    def passwd(self):
+        return credential_cache.get(self._f_method, *self._passwd_args)
+
+    @property
+    def passwd2(self):
+        return credential_cache.get(self._f_method, *self._passwd2_args)
 def f_dm_call(param: Tuple[str,SetParameters])->str:
     (value,params) = param
     if(value == "hai"):
@@ -0,0 +1,445 @@
+import argparse
+import base64
+import bz2
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+# Implementation of sections 2-5 of the data processing spec in test_mytest:
+# extract configured columns from a source table, decompress, turn
+# JSON/XML/query-string/nested values into JSON, mask, and stage. Generator
+# chain: read_chunks -> transform_chunks (process pool) -> write_staging.
+# Every stage pulls from the previous one and transform keeps at most
+# --max-inflight chunks in the pool, so a slow writer stalls reads instead
+# of piling chunks up in memory. SQLite stands in for source and staging;
+# mask_hook stands in for the DLP API.
+
+ENCODINGS = ("auto", "none", "gzip", "bz2", "base64", "base64+gzip", "base64+bz2")
+FORMATS = ("auto", "json", "xml", "qs", "text")
+MAX_NESTING = 8
+
+_B64_RE = re.compile(r"^[A-Za-z0-9+/\r\n]+={0,2}$")
+_QS_RE = re.compile(r"^[^\s=&]+=[^\s&]*(&[^\s=&]+=[^\s&]*)*$")
+
+
+class ColumnSpec:
+    """name[:encoding[:format]], e.g. payload:base64+gzip:xml."""
+
+    def __init__(self, spec: str):
+        parts = spec.split(":")
+        self.name = parts[0]
+        self.encoding = parts[1] if len(parts) > 1 and parts[1] else "auto"
+        self.format = parts[2] if len(parts) > 2 and parts[2] else "auto"
+        if self.encoding not in ENCODINGS:
+            raise SystemExit(f"{spec}: encoding must be one of {', '.join(ENCODINGS)}")
+        if self.format not in FORMATS:
+            raise SystemExit(f"{spec}: format must be one of {', '.join(FORMATS)}")
+
+
+# --- decompression -------------------------------------------------------
+
+def _unpack(data: bytes) -> bytes:
+    if data[:2] == b"\x1f\x8b":
+        return gzip.decompress(data)
+    if data[:3] == b"BZh":
+        return bz2.decompress(data)
+    return data
+
+
+def decompress(value: Any, encoding: str) -> Optional[str]:
+    """Raw column value -> text. auto sniffs gzip/bz2 magic, also under base64."""
+    if value is None:
+        return None
+    if encoding == "none":
+        return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+    data = value if isinstance(value, bytes) else str(value).encode("utf-8")
+    if encoding.startswith("base64"):
+        data = base64.b64decode(data)
+        encoding = encoding.partition("+")[2] or "none"
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    elif encoding == "bz2":
+        data = bz2.decompress(data)
+    elif encoding == "auto":
+        unpacked = _unpack(data)
+        if unpacked is data and len(data) >= 16 and _B64_RE.match(data.decode("latin-1")):
+            try:
+                raw = base64.b64decode(data, validate=False)
+            except ValueError:
+                raw = b""
+            if raw[:2] == b"\x1f\x8b" or raw[:3] == b"BZh":
+                unpacked = _unpack(raw)
+        data = unpacked
+    return data.decode("utf-8")
+
+
+# --- format conversion ---------------------------------------------------
+
+def xml_to_obj(elem: ET.Element) -> Any:
+    """Attributes as @name, text as #text (or the bare value), repeated children as lists."""
+    out: Dict[str, Any] = {f"@{k}": v for k, v in elem.attrib.items()}
+    for child in elem:
+        val = xml_to_obj(child)
+        if child.tag in out:
+            if not isinstance(out[child.tag], list):
+                out[child.tag] = [out[child.tag]]
+            out[child.tag].append(val)
+        else:
+            out[child.tag] = val
+    text = (elem.text or "").strip()
+    if not out:
+        return text
+    if text:
+        out["#text"] = text
+    return out
+
+
+def qs_to_obj(text: str) -> Dict[str, Any]:
+    parsed = parse_qs(text, keep_blank_values=True)
+    return {k: v[0] if len(v) == 1 else v for k, v in parsed.items()}
+
+
+def parse_value(text: str, fmt: str = "auto", depth: int = 0) -> Any:
+    """
+    Text -> JSON-able value. auto tries JSON, XML and query strings in that
+    order, and string leaves inside the result are parsed the same way
+    (JSON carrying XML or a query string, and so on), up to MAX_NESTING.
+    """
+    s = text.strip()
+    if fmt == "text":
+        return text
+    if fmt == "json" or (fmt == "auto" and s[:1] in ("{", "[")):
+        try:
+            return _parse_nested(json.loads(s), depth)
+        except ValueError:
+            if fmt == "json":
+                raise
+    if fmt == "xml" or (fmt == "auto" and s.startswith("<")):
+        try:
+            root = ET.fromstring(s)
+            return _parse_nested({root.tag: xml_to_obj(root)}, depth)
+        except ET.ParseError:
+            if fmt == "xml":
+                raise
+    if fmt == "qs" or (fmt == "auto" and _QS_RE.match(s)):
+        return _parse_nested(qs_to_obj(s), depth)
+    return text
+
+
+def _parse_nested(obj: Any, depth: int) -> Any:
+    if depth >= MAX_NESTING:
+        return obj
+    if isinstance(obj, dict):
+        return {k: _parse_nested(v, depth + 1) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_parse_nested(v, depth + 1) for v in obj]
+    if isinstance(obj, str):
+        s = obj.strip()
+        if s[:1] in ("{", "[", "<") or ("=" in s and _QS_RE.match(s)):
+            return parse_value(obj, "auto", depth + 1)
+    return obj
+
+
+# --- masking -------------------------------------------------------------
+
+SENSITIVE_KEYS = re.compile(r"(ssn|social|dob|birth|email|phone|first_?name|last_?name|member_?id|address)", re.I)
+
+
+def default_mask(column: str, obj: Any, key: bytes) -> Any:
+    """
+    Local stand-in for DLP re-application: every scalar of a
+    sensitive-looking column, or under a sensitive-looking key (list
+    elements and nested values included), becomes a deterministic
+    HMAC-SHA256 token ("tok_" + 16 hex), so joins on them still work
+    downstream without exposing the value.
+    """
+    if SENSITIVE_KEYS.search(column):
+        return _mask_all(obj, key)
+    if isinstance(obj, dict):
+        return {k: _mask_all(v, key) if SENSITIVE_KEYS.search(k) else default_mask(column, v, key)
+                for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [default_mask(column, v, key) for v in obj]
+    return obj
+
+
+def _mask_all(obj: Any, key: bytes) -> Any:
+    """Tokenise every scalar leaf of obj, keeping the dict/list shape."""
+    if isinstance(obj, dict):
+        return {k: _mask_all(v, key) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_mask_all(v, key) for v in obj]
+    return _token(obj, key)
+
+
+def _token(value: Any, key: bytes) -> str:
+    return "tok_" + hmac.new(key, str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def load_hook(path: Optional[str], key: bytes = b"") -> Optional[Callable[[str, Any], Any]]:
+    """
+    module:function -> callable(column, obj) -> obj; None disables masking.
+    The default hook needs a key: unkeyed HMAC tokens of SSNs, birth dates
+    or names can be reversed by hashing candidate values.
+    """
+    if not path or path == "none":
+        return None
+    if path == "default":
+        if not key:
+            raise SystemExit("--mask-hook default needs an HMAC key: set MASK_KEY or pass --mask-key")
+        return functools.partial(default_mask, key=key)
+    module, _, name = path.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+# --- stages --------------------------------------------------------------
+
+class StageCounter:
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = 0
+        self.seconds = 0.0
+        self.errors = 0
+
+    def rate(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: rows={self.rows} time={self.seconds:.2f}s rows/s={self.rate():.0f} errors={self.errors}"
+
+
+def read_chunks(conn: sqlite3.Connection, table: str, id_col: str, columns: List[ColumnSpec],
+                chunk_rows: int, counter: StageCounter) -> Iterator[List[Tuple[Any, ...]]]:
+    """Source rows (id, col1, col2, ...) in chunks of chunk_rows."""
+    cols = ", ".join(_quote(c) for c in [id_col] + [c.name for c in columns])
+    cur = conn.execute(f"SELECT {cols} FROM {_quote(table)}")
+    while True:
+        t0 = time.perf_counter()
+        rows = cur.fetchmany(chunk_rows)
+        counter.seconds += time.perf_counter() - t0
+        if not rows:
+            return
+        counter.rows += len(rows)
+        yield rows
+
+
+_worker_hook = None
+
+
+def _init_worker(hook_path: Optional[str], key: bytes) -> None:
+    global _worker_hook
+    _worker_hook = load_hook(hook_path, key)
+
+
+def transform_chunk(rows: List[Tuple[Any, ...]], columns: List[ColumnSpec]) -> Tuple[List[Tuple[Any, ...]], Dict[str, float]]:
+    """
+    Worker side: decompress, parse, mask every cell of a chunk. Returns
+    (staging rows (id, json..., errors), CPU seconds per step). A bad cell
+    becomes NULL plus an entry in the row's errors; the rest of the row
+    is kept.
+    """
+    spent = {"decompress": 0.0, "parse": 0.0, "mask": 0.0}
+    out = []
+    clock = time.process_time
+    for row in rows:
+        values: List[Optional[str]] = []
+        errors: Dict[str, str] = {}
+        for spec, raw in zip(columns, row[1:]):
+            step = "decompress"
+            try:
+                t0 = clock()
+                text = decompress(raw, spec.encoding)
+                t1 = clock()
+                spent["decompress"] += t1 - t0
+                if text is None:
+                    values.append(None)
+                    continue
+                step = "parse"
+                obj = parse_value(text, spec.format)
+                t2 = clock()
+                spent["parse"] += t2 - t1
+                if _worker_hook is not None:
+                    step = "mask"
+                    obj = _worker_hook(spec.name, obj)
+                    spent["mask"] += clock() - t2
+                values.append(json.dumps(obj, ensure_ascii=False))
+            except Exception as e:
+                values.append(None)
+                errors[spec.name] = f"{step}: {type(e).__name__}: {e}"
+        out.append((row[0], *values, json.dumps(errors) if errors else None))
+    return out, spent
+
+
+def transform_chunks(chunks: Iterator[List[Tuple[Any, ...]]], columns: List[ColumnSpec],
+                     pool: ProcessPoolExecutor, max_inflight: int,
+                     counters: Dict[str, StageCounter]) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    Fan chunks out to the pool, at most max_inflight at a time, and yield
+    results in source order. The next chunk is only read once the oldest
+    one has been handed downstream.
+    """
+    inflight: Deque = deque()
+    wait = counters["transform_wait"]
+    for chunk in chunks:
+        inflight.append(pool.submit(transform_chunk, chunk, columns))
+        if len(inflight) >= max_inflight:
+            yield _collect(inflight.popleft(), counters, wait)
+    while inflight:
+        yield _collect(inflight.popleft(), counters, wait)
+
+
+def _collect(fut, counters: Dict[str, StageCounter], wait: StageCounter) -> List[Tuple[Any, ...]]:
+    t0 = time.perf_counter()
+    rows, spent = fut.result()
+    wait.seconds += time.perf_counter() - t0
+    wait.rows += len(rows)
+    for step in ("decompress", "parse", "mask"):
+        counters[step].rows += len(rows)
+        counters[step].seconds += spent[step]
+    return rows
+
+
+def write_staging(conn: sqlite3.Connection, table: str, columns: List[ColumnSpec],
+                  chunks: Iterator[List[Tuple[Any, ...]]], batch_rows: int, counter: StageCounter,
+                  progress: Optional[Callable[[], None]] = None) -> None:
+    """executemany + commit per batch_rows into the staging table."""
+    names = ["source_id"] + [c.name for c in columns] + ["errors"]
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({', '.join(_quote(n) + ' TEXT' for n in names)})")
+    insert = f"INSERT INTO {_quote(table)} VALUES ({', '.join('?' * len(names))})"
+    pending: List[Tuple[Any, ...]] = []
+
+    def flush():
+        t0 = time.perf_counter()
+        conn.executemany(insert, pending)
+        conn.commit()
+        counter.seconds += time.perf_counter() - t0
+        counter.rows += len(pending)
+        counter.errors += sum(1 for r in pending if r[-1])
+        pending.clear()
+        if progress:
+            progress()
+
+    for rows in chunks:
+        pending.extend(rows)
+        if len(pending) >= batch_rows:
+            flush()
+    if pending:
+        flush()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def make_synthetic(path: str, rows: int, seed: int = 1) -> None:
+    """Source table `source_records` with gzip/base64 XML, bz2 JSON carrying XML and query strings, plain query strings."""
+    rnd = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE source_records (id INTEGER PRIMARY KEY, claim_xml TEXT, event_json BLOB, params TEXT)")
+    batch = []
+    for i in range(rows):
+        xml = (f"<claim id=\"{i}\"><member><member_id>M{i:08d}</member_id><dob>19{rnd.randint(40, 99)}-01-0{rnd.randint(1, 9)}</dob></member>"
+               + "".join(f"<line n=\"{n}\"><code>C{rnd.randint(100, 999)}</code><amount>{rnd.random() * 500:.2f}</amount></line>"
+                         for n in range(rnd.randint(1, 4)))
+               + "</claim>")
+        event = json.dumps({
+            "type": "auth.update", "seq": i,
+            "detail": f"<note author=\"u{i % 50}\">Called member about auth {i}</note>",
+            "ctx": f"email=user{i}%40example.com&channel=phone&retry={i % 3}",
+        })
+        if i % 997 == 0:
+            # an error with event_json:bz2, passed through as text with auto
+            event_blob = b"not compressed at all"
+        else:
+            event_blob = bz2.compress(event.encode("utf-8"))
+        batch.append((i, base64.b64encode(gzip.compress(xml.encode("utf-8"))).decode("ascii"), event_blob,
+                      f"first_name=Pat{i}&last_name=Lee&plan=GOLD&zip={10000 + i % 90000}"))
+        if len(batch) >= 10000:
+            conn.executemany("INSERT INTO source_records VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO source_records VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Decompress, normalize to JSON, mask and stage source columns")
+    p.add_argument("--source", help="Source SQLite database")
+    p.add_argument("--table", default="source_records")
+    p.add_argument("--id-col", default="id")
+    p.add_argument("--column", action="append", default=[], metavar="NAME[:ENCODING[:FORMAT]]",
+                   help=f"Column to process (repeatable). encoding: {', '.join(ENCODINGS)}; format: {', '.join(FORMATS)}")
+    p.add_argument("--staging", default=None, help="Staging SQLite database (default: --source)")
+    p.add_argument("--staging-table", default="staging_normalized")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Transform processes")
+    p.add_argument("--chunk-rows", type=int, default=2000, help="Rows per source read / pool task")
+    p.add_argument("--max-inflight", type=int, default=None, help="Chunks in the pool at once (default: 2 x workers)")
+    p.add_argument("--insert-batch", type=int, default=10000, help="Rows per staging insert + commit")
+    p.add_argument("--mask-hook", default="default",
+                   help="default | none | module:function(column, obj) -> obj, applied after parsing")
+    p.add_argument("--mask-key", default=os.environ.get("MASK_KEY", ""), help="HMAC key for the default hook (env MASK_KEY); required with --mask-hook default")
+    p.add_argument("--make-synthetic", nargs=2, metavar=("DB", "ROWS"), default=None,
+                   help="Write a synthetic source DB and exit")
+    args = p.parse_args()
+
+    if args.make_synthetic:
+        make_synthetic(args.make_synthetic[0], int(args.make_synthetic[1]))
+        print(f"synthetic source: {args.make_synthetic[1]} rows -> {args.make_synthetic[0]} (table source_records)")
+        return
+    if not args.source or not args.column:
+        p.error("--source and at least one --column are required")
+
+    columns = [ColumnSpec(c) for c in args.column]
+    # fail early on a bad hook path or a missing key, not in every worker
+    load_hook(args.mask_hook, args.mask_key.encode("utf-8"))
+    workers = max(args.workers, 1)
+    max_inflight = args.max_inflight or workers * 2
+
+    src = sqlite3.connect(args.source)
+    dst = sqlite3.connect(args.staging or args.source)
+    dst.execute("PRAGMA journal_mode=WAL")
+    dst.execute("PRAGMA synchronous=NORMAL")
+
+    counters = {name: StageCounter(name) for name in ("read", "decompress", "parse", "mask", "transform_wait", "write")}
+    started = time.time()
+    last = [started]
+
+    def progress():
+        if time.time() - last[0] >= 5:
+            last[0] = time.time()
+            w = counters["write"]
+            print(f"staged={w.rows} rows/s={w.rows / (last[0] - started):.0f}")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(args.mask_hook, args.mask_key.encode("utf-8"))) as pool:
+        chunks = read_chunks(src, args.table, args.id_col, columns, args.chunk_rows, counters["read"])
+        transformed = transform_chunks(chunks, columns, pool, max_inflight, counters)
+        write_staging(dst, args.staging_table, columns, transformed, args.insert_batch, counters["write"], progress)
+
+    src.close()
+    dst.close()
+    elapsed = time.time() - started
+    print(f"DONE rows={counters['write'].rows} time={elapsed:.1f}s rows/s={counters['write'].rows / elapsed if elapsed else 0:.0f}")
+    # decompress/parse/mask are CPU seconds summed over workers; transform_wait
+    # is how long the writer waited on the pool (high = transform-bound)
+    for c in counters.values():
+        print(" ", c)
+
+
+if __name__ == "__main__":
+    main()
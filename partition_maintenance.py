@@ -0,0 +1,224 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+# Driver version of save_me(tables_to_drop TEXT[]) from test_mytest: detach
+# each partition from its parent and drop it. Differences from the function:
+#   - one catalog query resolves every table (real parent from pg_inherits,
+#     not split_part(name, '_', 1)), instead of an EXISTS per table;
+#   - DETACH PARTITION ... CONCURRENTLY in autocommit, so the parent only
+#     takes SHARE UPDATE EXCLUSIVE and readers/writers aren't blocked, and
+#     nothing is held across the whole batch;
+#   - partitions of one parent run in order on one connection (a parent can
+#     only have one concurrent detach pending), different parents in
+#     parallel over a connection pool.
+# Needs PostgreSQL 14+ (CONCURRENTLY, pg_inherits.inhdetachpending) and
+# psycopg2 (or psycopg2-binary).
+
+CATALOG_SQL = """
+WITH wanted AS (
+    SELECT name, ord
+    FROM unnest(%s::text[]) WITH ORDINALITY AS w(name, ord)
+)
+SELECT w.name,
+       c.oid IS NOT NULL                    AS table_exists,
+       cn.nspname                           AS schema_name,
+       c.relname                            AS table_name,
+       pn.nspname                           AS parent_schema,
+       p.relname                            AS parent_name,
+       COALESCE(i.inhdetachpending, false)  AS detach_pending,
+       COALESCE(pt.partdefid <> 0, false)   AS parent_has_default
+FROM wanted w
+LEFT JOIN pg_class c ON c.oid = to_regclass(CASE WHEN strpos(w.name, '.') > 0 THEN w.name ELSE quote_ident(w.name) END)
+LEFT JOIN pg_namespace cn ON cn.oid = c.relnamespace
+LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+LEFT JOIN pg_class p ON p.oid = i.inhparent AND p.relkind = 'p'
+LEFT JOIN pg_namespace pn ON pn.oid = p.relnamespace
+LEFT JOIN pg_partitioned_table pt ON pt.partrelid = p.oid
+ORDER BY w.ord
+"""
+
+
+def _driver():
+    try:
+        import psycopg2
+        import psycopg2.pool
+        from psycopg2 import sql
+    except ImportError:
+        raise SystemExit("partition_maintenance.py needs psycopg2: pip install psycopg2-binary")
+    return psycopg2, sql
+
+
+def resolve_tables(conn, tables: List[str]) -> List[Dict[str, Any]]:
+    """Every requested table with its schema, parent (if attached) and detach mode, in one query."""
+    with conn.cursor() as cur:
+        cur.execute(CATALOG_SQL, (tables,))
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+def plan_groups(resolved: List[Dict[str, Any]]) -> Dict[Optional[tuple], List[Dict[str, Any]]]:
+    """
+    Group by parent. Tables that aren't attached partitions (plain tables,
+    already detached) have no ordering constraint, so each is its own group.
+    Missing tables are skipped, like save_me's DROP TABLE IF EXISTS.
+    """
+    groups: Dict[Any, List[Dict[str, Any]]] = {}
+    for t in resolved:
+        if not t["table_exists"]:
+            continue
+        if t["parent_name"]:
+            key = (t["parent_schema"], t["parent_name"])
+        else:
+            key = ("", t["schema_name"], t["table_name"])
+        groups.setdefault(key, []).append(t)
+    return groups
+
+
+def statements(t: Dict[str, Any], sql, concurrently: bool) -> List[Any]:
+    """DETACH (if attached) and DROP for one table, as psycopg2.sql objects."""
+    child = sql.Identifier(t["schema_name"], t["table_name"])
+    out = []
+    if t["parent_name"]:
+        parent = sql.Identifier(t["parent_schema"], t["parent_name"])
+        if t["detach_pending"]:
+            # an earlier CONCURRENTLY detach was interrupted; it can only be finished
+            mode = sql.SQL("FINALIZE")
+        elif concurrently and not t["parent_has_default"]:
+            # CONCURRENTLY isn't allowed when the parent has a default partition
+            mode = sql.SQL("CONCURRENTLY")
+        else:
+            mode = sql.SQL("")
+        out.append(("detach", sql.SQL("ALTER TABLE {} DETACH PARTITION {} {}").format(parent, child, mode)))
+    out.append(("drop", sql.SQL("DROP TABLE IF EXISTS {}").format(child)))
+    return out
+
+
+def process_group(pool, tables: List[Dict[str, Any]], sql, concurrently: bool,
+                  lock_timeout_ms: int) -> List[Dict[str, Any]]:
+    """Detach/drop one parent's partitions in order on one pooled connection."""
+    results = []
+    conn = pool.getconn()
+    try:
+        # DETACH ... CONCURRENTLY can't run inside a transaction block
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SET lock_timeout = %s", (f"{lock_timeout_ms}ms",))
+            for t in tables:
+                res = {"table": f"{t['schema_name']}.{t['table_name']}",
+                       "parent": f"{t['parent_schema']}.{t['parent_name']}" if t["parent_name"] else "",
+                       "detach_ms": "", "drop_ms": "", "ok": True, "error": ""}
+                for step, stmt in statements(t, sql, concurrently):
+                    started = time.perf_counter()
+                    try:
+                        cur.execute(stmt)
+                    except Exception as e:
+                        res["ok"] = False
+                        res["error"] = f"{step}: {str(e).strip()}"
+                        break
+                    finally:
+                        res[f"{step}_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                results.append(res)
+    finally:
+        pool.putconn(conn)
+    return results
+
+
+def setup_demo(conn, parents: int, partitions: int) -> List[str]:
+    """Throwaway partitioned tables demo_p<i> with range partitions demo_p<i>_<j>; returns partition names."""
+    names = []
+    with conn.cursor() as cur:
+        for i in range(parents):
+            parent = f"demo_p{i}"
+            cur.execute(f"DROP TABLE IF EXISTS {parent} CASCADE")
+            cur.execute(f"CREATE TABLE {parent} (id bigint, payload text) PARTITION BY RANGE (id)")
+            for j in range(partitions):
+                child = f"{parent}_{j}"
+                cur.execute(f"CREATE TABLE {child} PARTITION OF {parent} FOR VALUES FROM ({j * 1000}) TO ({(j + 1) * 1000})")
+                cur.execute(f"INSERT INTO {child} SELECT g, md5(g::text) FROM generate_series({j * 1000}, {j * 1000 + 999}) g")
+                names.append(child)
+    return names
+
+
+def main():
+    p = argparse.ArgumentParser(description="Detach and drop partitions in bulk (parallel save_me())")
+    p.add_argument("--dsn", required=True, help="libpq connection string, e.g. 'dbname=test host=localhost'")
+    p.add_argument("tables", nargs="*", help="Tables to detach/drop ([schema.]name)")
+    p.add_argument("--tables-file", default=None, help="...or one table per line")
+    p.add_argument("--parallel", type=int, default=4, help="Parents processed at once (pool size)")
+    p.add_argument("--no-concurrently", action="store_true", help="Plain DETACH (takes ACCESS EXCLUSIVE on the parent)")
+    p.add_argument("--lock-timeout-ms", type=int, default=10000, help="Give up on a table waiting longer than this for a lock")
+    p.add_argument("--dry-run", action="store_true", help="Print the plan, change nothing")
+    p.add_argument("--report", default=None, help="Per-table timings as CSV")
+    p.add_argument("--setup-demo", nargs=2, type=int, metavar=("PARENTS", "PARTITIONS"), default=None,
+                   help="Create demo partitioned tables in --dsn and process all their partitions")
+    args = p.parse_args()
+
+    psycopg2, sql = _driver()
+    tables = list(args.tables)
+    if args.tables_file:
+        with open(args.tables_file, encoding="utf-8") as f:
+            tables += [line.strip() for line in f if line.strip()]
+
+    pool = psycopg2.pool.ThreadedConnectionPool(1, max(args.parallel, 1), args.dsn)
+    try:
+        conn = pool.getconn()
+        try:
+            # no transaction left open on a connection that goes back to the pool
+            conn.autocommit = True
+            if args.setup_demo:
+                tables += setup_demo(conn, *args.setup_demo)
+            if not tables:
+                p.error("no tables given")
+            resolved = resolve_tables(conn, tables)
+            concurrently = not args.no_concurrently
+
+            missing = [t["name"] for t in resolved if not t["table_exists"]]
+            groups = plan_groups(resolved)
+            print(f"{len(tables)} tables, {len(groups)} groups, {len(missing)} missing")
+            for name in missing:
+                print(f"  skip {name}: does not exist")
+            if args.dry_run:
+                for key, members in groups.items():
+                    label = f"parent {key[0]}.{key[1]}" if len(key) == 2 else "not a partition"
+                    print(f"-- {label}")
+                    for t in members:
+                        for _, stmt in statements(t, sql, concurrently):
+                            print(f"{stmt.as_string(conn)};")
+                return
+        finally:
+            pool.putconn(conn)
+
+        started = time.time()
+        results: List[Dict[str, Any]] = []
+        with ThreadPoolExecutor(max_workers=max(args.parallel, 1)) as ex:
+            futures = [ex.submit(process_group, pool, members, sql, concurrently, args.lock_timeout_ms)
+                       for members in groups.values()]
+            for fut in as_completed(futures):
+                for res in fut.result():
+                    results.append(res)
+                    status = "ok" if res["ok"] else f"FAILED ({res['error']})"
+                    print(f"{res['table']:<40} detach={res['detach_ms']}ms drop={res['drop_ms']}ms {status}")
+    finally:
+        pool.closeall()
+
+    failed = [r for r in results if not r["ok"]]
+    print(f"done: {len(results) - len(failed)} ok, {len(failed)} failed, {len(missing)} skipped "
+          f"in {time.time() - started:.1f}s")
+    if args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        with open(args.report, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=["table", "parent", "detach_ms", "drop_ms", "ok", "error"])
+            w.writeheader()
+            w.writerows(results)
+        print("report:", args.report)
+    # save_me returns false if any table failed
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
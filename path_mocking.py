@@ -1,19 +1,150 @@
 #my_module.py
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
 import requests
 
+API_URL = "https://example.com/api"
+
 class Database:
     def get_data(self):
         return "real DB data"
 
+# API and DB calls of the sync wrapper run side by side on this pool
+_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch_and_store")
+
 def fetch_and_store():
-    response = requests.get("https://example.com/api")
-    api_data = response.json()
-    
-    db = Database()
-    db_data = db.get_data()
+    # requests.get / Database are looked up at call time so patch() and
+    # responses keep working; both calls overlap instead of adding up
+    api_future = _pool.submit(requests.get, API_URL)
+    db_future = _pool.submit(lambda: Database().get_data())
+    api_data = api_future.result().json()
+    db_data = db_future.result()
 
     return {"api": api_data, "db": db_data}
 
+
+class TTLCache:
+    """LRU of at most maxsize entries, each valid for ttl_s seconds."""
+
+    def __init__(self, ttl_s, maxsize=1024):
+        self.ttl_s = ttl_s
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key):
+        """(True, value) on a fresh hit, (False, None) otherwise."""
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl_s, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+
+class CoalescingSource:
+    """
+    Cache + single flight in front of an async loader: concurrent get(key)
+    calls for a key that is already being loaded await that same load.
+    Failures are not cached and reach every waiter.
+    """
+
+    def __init__(self, load, cache=None):
+        self._load = load
+        self.cache = cache
+        self._inflight = {}
+        self.loads = 0
+
+    async def get(self, key):
+        if self.cache is not None:
+            hit, value = self.cache.get(key)
+            if hit:
+                return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the others' load
+        return await asyncio.shield(task)
+
+    async def _fill(self, key):
+        self.loads += 1
+        value = await self._load(key)
+        if self.cache is not None:
+            self.cache.set(key, value)
+        return value
+
+
+class AsyncFetchAndStore:
+    """
+    Async fetch_and_store over one pooled aiohttp session. The API and DB
+    calls run concurrently; each source can sit behind a TTL/LRU cache
+    (api_ttl_s / db_ttl_s > 0) and concurrent callers share in-flight
+    fetches. Database().get_data() is blocking, so it runs in a thread.
+
+        async with AsyncFetchAndStore(api_ttl_s=30) as fetch:
+            results = await asyncio.gather(*(fetch() for _ in range(100)))
+    """
+
+    def __init__(self, url=API_URL, api_ttl_s=0.0, db_ttl_s=0.0, cache_size=1024,
+                 timeout_s=30.0, limit=100, database_factory=None):
+        self.url = url
+        self.timeout_s = timeout_s
+        self.limit = limit
+        self.database_factory = database_factory or (lambda: Database())
+        self.session = None
+        self.api = CoalescingSource(self._load_api, TTLCache(api_ttl_s, cache_size) if api_ttl_s > 0 else None)
+        self.db = CoalescingSource(self._load_db, TTLCache(db_ttl_s, cache_size) if db_ttl_s > 0 else None)
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout_s))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def _load_api(self, url):
+        async with self.session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    async def _load_db(self, _key):
+        return await asyncio.to_thread(lambda: self.database_factory().get_data())
+
+    async def __call__(self, url=None):
+        api_data, db_data = await asyncio.gather(self.api.get(url or self.url), self.db.get("db"))
+        return {"api": api_data, "db": db_data}
+
+
+async def fetch_and_store_async(url=API_URL, client=None):
+    """One call; pass a long-lived AsyncFetchAndStore to reuse its session and caches."""
+    if client is not None:
+        return await client(url)
+    async with AsyncFetchAndStore(url) as client:
+        return await client(url)
+
 #------------- Using Multiple patch Decorators
 from unittest.mock import patch, MagicMock
 import unittest
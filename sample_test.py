@@ -1,11 +1,26 @@
 import argparse
 import asyncio
+import bisect
+import contextlib
 import csv
+import hashlib
+import heapq
 import json
+import math
+import mmap
+import multiprocessing
 import os
+import shutil
 import random
+import sqlite3
+import struct
 import time
-from typing import Dict, Any, Optional
+from array import array
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import aiohttp
 
@@ -34,18 +49,30 @@ def build_payload(row: Dict[str, str]) -> Dict[str, Any]:
     }
 
 
-def parse_returned_id(resp_json: Any, external_member_id: str) -> Optional[str]:
+def build_batch_payload(rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Same template as build_payload, with one `notes` entry per row.
+    Rows must share a VisibleID (see iter_batches).
+    """
+    payload = build_payload(rows[0])
+    for r in rows[1:]:
+        payload["notes"].extend(build_payload(r)["notes"])
+    return payload
+
+
+def parse_returned_id(resp_json: Any, external_member_id: str, index: int = 0) -> Optional[str]:
     """
     If response format is:
       { "data": { "<ExternalMemberID>": ["returnedId"] }, "success": true/false, ... }
+    index picks the n-th id when a batch holds several notes for one member.
     """
     try:
         if isinstance(resp_json, dict):
             data = resp_json.get("data")
             if isinstance(data, dict):
                 arr = data.get(external_member_id)
-                if isinstance(arr, list) and arr:
-                    rid = arr[0]
+                if isinstance(arr, list) and len(arr) > index:
+                    rid = arr[index]
                     if rid in (None, "null", ""):
                         return None
                     return str(rid)
@@ -54,105 +81,1750 @@ def parse_returned_id(resp_json: Any, external_member_id: str) -> Optional[str]:
     return None
 
 
-async def post_one(
-    session: aiohttp.ClientSession,
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After header -> seconds to wait.
+    Accepts both forms from RFC 9110: delta-seconds or an HTTP-date.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(when.timestamp() - time.time(), 0.0)
+    except Exception:
+        return None
+
+
+def percentile(sorted_vals, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (q in 0..100)."""
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(q / 100 * len(sorted_vals)) - 1))
+    return float(sorted_vals[k])
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter, drop-in replacement for asyncio.Semaphore
+    (`async with limiter:`) whose window moves with the API's behaviour:
+
+      - every ~window completions, if p95 (and p50 if set) of elapsed_ms is
+        under target -> window += 1
+      - latency over target -> window *= 0.9
+      - 429/503/timeout -> window *= 0.5 (at most once per cooldown, so one
+        burst of throttled responses doesn't collapse the window to 1)
+      - Retry-After -> no new acquisitions until it expires
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_window: int = 1,
+        max_window: int = 64,
+        target_p95_ms: float = 1000,
+        target_p50_ms: float = 0,
+        sample_size: int = 200,
+    ):
+        self.min_window = max(1, min_window)
+        self.max_window = max(self.min_window, max_window)
+        self.window = float(min(max(initial, self.min_window), self.max_window))
+        self.target_p95_ms = target_p95_ms
+        self.target_p50_ms = target_p50_ms
+        self.in_flight = 0
+        self._latencies = deque(maxlen=sample_size)
+        self._since_adjust = 0
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._waiters = deque()
+
+    @property
+    def limit(self) -> int:
+        return int(self.window)
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                else:
+                    self._wake()  # we were woken; pass the slot on
+                raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+    def _wake(self) -> None:
+        free = self.limit - self.in_flight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def _cooldown_s(self) -> float:
+        # roughly one round trip
+        if not self._latencies:
+            return 1.0
+        return max(0.05, percentile(sorted(self._latencies), 50) / 1000)
+
+    def _decrease(self, factor: float) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._cooldown_s():
+            return
+        self._last_decrease = now
+        self._since_adjust = 0
+        self.window = max(float(self.min_window), self.window * factor)
+
+    def observe(
+        self,
+        elapsed_ms: Optional[float],
+        overloaded: bool = False,
+        retry_after_s: Optional[float] = None,
+    ) -> None:
+        """Feed one attempt's outcome (called by post_one)."""
+        if retry_after_s:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after_s)
+        if overloaded:
+            self._decrease(0.5)
+            return
+
+        if elapsed_ms is not None and elapsed_ms != "":
+            self._latencies.append(float(elapsed_ms))
+        self._since_adjust += 1
+        if self._since_adjust < max(self.limit, 10):
+            return
+        self._since_adjust = 0
+
+        lat = sorted(self._latencies)
+        p95 = percentile(lat, 95)
+        p50 = percentile(lat, 50)
+        if p95 <= self.target_p95_ms and (not self.target_p50_ms or p50 <= self.target_p50_ms):
+            self.window = min(float(self.max_window), self.window + 1)
+            self._wake()
+        else:
+            self._decrease(0.9)
+
+
+class LoopLagMonitor:
+    """
+    --profile: wakes every interval_s and records how late it woke up into
+    metrics' loop_lag. Lag means some callback held the event loop (CSV
+    parsing, JSON, progress printing...) and every request waited on it.
+    """
+
+    def __init__(self, metrics: "Metrics", interval_s: float = 0.02):
+        self.metrics = metrics
+        self.interval_s = interval_s
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.metrics.observe("loop_lag", max(loop.time() - t0 - self.interval_s, 0.0) * 1000)
+
+
+def cpu_timed(items: Iterable, metrics: "Metrics", stage: str) -> Iterator:
+    """Pass items through, charging the CPU spent producing each one to stage."""
+    it = iter(items)
+    while True:
+        c0 = time.thread_time()
+        try:
+            item = next(it)
+        except StopIteration:
+            metrics.add_cpu(stage, time.thread_time() - c0)
+            return
+        metrics.add_cpu(stage, time.thread_time() - c0)
+        yield item
+
+
+class TokenBucket:
+    """
+    Async token bucket for --max-rps: `rate` requests/s on average, bursts
+    of up to `burst`. Every HTTP attempt takes a token (retries included),
+    so the contractual quota holds even during a 429/5xx retry storm.
+    Waiters are served FIFO.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram: log-spaced buckets (~1% relative error),
+    O(1) record, fixed memory however many samples, and mergeable across
+    --workers shards via snapshot()/merge().
+    """
+
+    GROWTH = 1.02
+    MIN_MS = 0.001
+    _LOG_GROWTH = math.log(GROWTH)
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        idx = 0 if ms <= self.MIN_MS else math.ceil(math.log(ms / self.MIN_MS) / self._LOG_GROWTH)
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(self.MIN_MS * self.GROWTH ** idx, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"counts": dict(self.counts), "count": self.count, "sum_ms": self.sum_ms, "max_ms": self.max_ms}
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        for idx, c in snap["counts"].items():
+            self.counts[int(idx)] += c
+        self.count += snap["count"]
+        self.sum_ms += snap["sum_ms"]
+        self.max_ms = max(self.max_ms, snap["max_ms"])
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Metrics:
+    """
+    Per-stage timings and error breakdown for a bulk run.
+
+    Stages (ms): queue_wait (waiting for a concurrency slot), rate_wait
+    (--max-rps token), connect (new connection incl. DNS/TLS, from the
+    transport's trace hooks - only for attempts that opened one), ttfb (request
+    fully written -> response headers, so pool wait and connection setup are
+    not in it), body (reading the body), total (whole attempt, i.e. also the
+    wait for a pooled connection, connect and sending).
+    Counters: attempts by outcome (http_<status> / exc_<ExceptionType>)
+    and final row results by ok/fail + httpStatus.
+
+    With profile=True (--profile) also loop_lag (how late a periodic timer
+    fires = time the event loop was blocked) and event-loop-thread CPU
+    seconds per local stage in `cpu`: read (input, dedup/resume filters,
+    batching), build (payload dicts, hash, encode), decode (response JSON
+    + result rows), record (outputs, journal, progress). What the loop
+    thread spent beyond those is aiohttp and the loop itself.
+    """
+
+    STAGES = ("queue_wait", "rate_wait", "connect", "ttfb", "body", "total", "loop_lag")
+    CPU_STAGES = ("read", "build", "decode", "record")
+
+    def __init__(self, profile: bool = False):
+        self.hist = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.attempts: Counter = Counter()
+        self.results: Counter = Counter()
+        self.gauges: Dict[str, float] = {}
+        self.profile = profile
+        # seconds: CPU_STAGES, plus loop_thread / process CPU and wall for the run (and runs: 1 per shard)
+        self.cpu: Counter = Counter()
+
+    def add_cpu(self, stage: str, seconds: float) -> None:
+        self.cpu[stage] += seconds
+
+    def observe(self, stage: str, ms: float) -> None:
+        self.hist[stage].record(ms)
+
+    def attempt(self, outcome: str) -> None:
+        self.attempts[outcome] += 1
+
+    def result(self, res: Dict[str, Any]) -> None:
+        if res.get("ok"):
+            self.results["ok"] += 1
+        elif res.get("httpStatus") != "":
+            self.results[f"fail_http_{res.get('httpStatus')}"] += 1
+        else:
+            self.results[f"fail_{res.get('error', '').split(':', 1)[0] or 'unknown'}"] += 1
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp hooks timing connection setup and the end of sending into the request's trace ctx."""
+        tc = aiohttp.TraceConfig()
+
+        async def on_conn_start(session, ctx, params):
+            if ctx.trace_request_ctx is not None:
+                ctx.trace_request_ctx["conn_t0"] = time.perf_counter()
+
+        async def on_conn_end(session, ctx, params):
+            t = ctx.trace_request_ctx
+            if t is not None and "conn_t0" in t:
+                self.observe("connect", (time.perf_counter() - t["conn_t0"]) * 1000)
+
+        async def on_sent(session, ctx, params):
+            # headers, then each body chunk: the last one is when the request is fully written
+            if ctx.trace_request_ctx is not None:
+                ctx.trace_request_ctx["sent_t"] = time.time()
+
+        tc.on_connection_create_start.append(on_conn_start)
+        tc.on_connection_create_end.append(on_conn_end)
+        tc.on_request_headers_sent.append(on_sent)
+        tc.on_request_chunk_sent.append(on_sent)
+        return tc
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "hist": {k: h.snapshot() for k, h in self.hist.items()},
+            "attempts": dict(self.attempts),
+            "results": dict(self.results),
+            "cpu": dict(self.cpu),
+        }
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        for k, h in snap["hist"].items():
+            self.hist[k].merge(h)
+        self.attempts.update(snap["attempts"])
+        self.results.update(snap["results"])
+        self.cpu.update(snap.get("cpu", {}))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "latency": {k: h.summary() for k, h in self.hist.items()},
+            "attempts": dict(self.attempts.most_common()),
+            "results": dict(self.results.most_common()),
+            "gauges": dict(self.gauges),
+            **({"cpu_s": {k: round(v, 4) for k, v in self.cpu.items()}} if self.cpu else {}),
+        }
+
+    def write_json(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# TYPE bulk_stage_latency_ms summary",
+        ]
+        for stage, h in self.hist.items():
+            for q in (0.5, 0.95, 0.99):
+                lines.append(f'bulk_stage_latency_ms{{stage="{stage}",quantile="{q}"}} {h.percentile(q * 100):.3f}')
+            lines.append(f'bulk_stage_latency_ms_sum{{stage="{stage}"}} {h.sum_ms:.3f}')
+            lines.append(f'bulk_stage_latency_ms_count{{stage="{stage}"}} {h.count}')
+        lines.append("# TYPE bulk_attempts_total counter")
+        for outcome, c in sorted(self.attempts.items()):
+            lines.append(f'bulk_attempts_total{{outcome="{outcome}"}} {c}')
+        lines.append("# TYPE bulk_rows_total counter")
+        for result, c in sorted(self.results.items()):
+            lines.append(f'bulk_rows_total{{result="{result}"}} {c}')
+        if self.cpu:
+            lines.append("# TYPE bulk_cpu_seconds_total counter")
+            for stage, v in sorted(self.cpu.items()):
+                lines.append(f'bulk_cpu_seconds_total{{stage="{stage}"}} {v:.6f}')
+        for name, v in sorted(self.gauges.items()):
+            lines.append(f"# TYPE bulk_{name} gauge")
+            lines.append(f"bulk_{name} {v}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, port: int, host: str = "127.0.0.1"):
+        """Start a local Prometheus scrape endpoint at /metrics; returns the runner to clean up."""
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.prometheus_text(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+class JsonCodec:
+    """
+    JSON encode/decode pair used on the request hot path: payloads are
+    encoded to bytes once per request (not once per attempt) and responses
+    decoded straight from the body bytes, no intermediate str.
+    """
+
+    def __init__(self, name: str, dumps, loads):
+        self.name = name
+        self.dumps = dumps  # obj -> bytes
+        self.loads = loads  # bytes -> obj
+
+
+def get_codec(name: str = "auto") -> JsonCodec:
+    """orjson / msgspec if installed (auto prefers orjson), stdlib json otherwise."""
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+            return JsonCodec("orjson", orjson.dumps, orjson.loads)
+        except ImportError:
+            if name == "orjson":
+                raise
+    if name in ("auto", "msgspec"):
+        try:
+            import msgspec
+            return JsonCodec("msgspec", msgspec.json.Encoder().encode, msgspec.json.Decoder().decode)
+        except ImportError:
+            if name == "msgspec":
+                raise
+    return JsonCodec(
+        "json",
+        lambda obj: json.dumps(obj).encode("utf-8"),
+        json.loads,  # accepts bytes directly
+    )
+
+
+STDLIB_CODEC = get_codec("json")
+
+
+class Transport:
+    """
+    HTTP client under send_payload. post() returns
+    (status, response headers, body bytes, time.time() when headers arrived)
+    and raises asyncio.TimeoutError on timeouts, like aiohttp. With a
+    trace_ctx it also sets trace_ctx["sent_t"], time.time() when the request
+    was fully written (the start of the ttfb stage).
+    """
+
+    name = ""
+
+    async def post(self, url: str, data: bytes, headers: Dict[str, str], timeout_s: float,
+                   trace_ctx: Optional[Dict[str, Any]]) -> Tuple[int, Any, bytes, float]:
+        raise NotImplementedError
+
+    async def warm_up(self, url: str, n: int, headers: Dict[str, str]) -> int:
+        """
+        Open keep-alive connections before the first row: n concurrent GETs
+        of url (a cheap endpoint such as a health check; any status will
+        do), each leaving its connection in the pool. Returns how many got
+        a response.
+        """
+
+        async def one() -> int:
+            try:
+                await self._get(url, headers)
+                return 1
+            except Exception:
+                return 0
+
+        return sum(await asyncio.gather(*(one() for _ in range(n))))
+
+    async def _get(self, url: str, headers: Dict[str, str]) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class AiohttpTransport(Transport):
+    """
+    aiohttp, pooled for many small POSTs to one host: DNS answers cached for
+    dns_ttl_s (aiohttp's default is 10s), idle connections kept keepalive_s
+    (default 15s) so gaps between bursts don't cost new handshakes, and an
+    optional per-host cap under the pool limit. aiohttp already sets
+    TCP_NODELAY on every connection it opens.
+    """
+
+    name = "aiohttp"
+
+    def __init__(self, limit: int, ssl=None, trace_configs=None, dns_ttl_s: int = 300,
+                 keepalive_s: float = 60.0, limit_per_host: int = 0):
+        connector = aiohttp.TCPConnector(ssl=ssl, limit=limit, limit_per_host=limit_per_host,
+                                         ttl_dns_cache=dns_ttl_s, keepalive_timeout=keepalive_s)
+        self.session = aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+
+    async def post(self, url, data, headers, timeout_s, trace_ctx):
+        async with self.session.post(url, data=data, headers=headers, timeout=timeout_s,
+                                     trace_request_ctx=trace_ctx) as resp:
+            t_headers = time.time()
+            return resp.status, resp.headers, await resp.read(), t_headers
+
+    async def _get(self, url, headers):
+        async with self.session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+            await resp.read()
+
+    async def close(self):
+        await self.session.close()
+
+
+class Http2Transport(Transport):
+    """
+    httpx over HTTP/2 (needs `pip install httpx h2`): requests to a host
+    are multiplexed as streams over one connection instead of one
+    connection per in-flight request. http:// URLs use prior knowledge
+    (h2c, the server must accept it); https:// negotiates h2 by ALPN and
+    falls back to HTTP/1.1.
+    """
+
+    name = "http2"
+
+    def __init__(self, limit: int, verify: bool = True, metrics: Optional["Metrics"] = None,
+                 keepalive_s: float = 60.0, prior_knowledge: bool = False):
+        try:
+            import httpx
+        except ImportError:
+            raise SystemExit("--transport http2 needs httpx and h2: pip install 'httpx[http2]'")
+        self._httpx = httpx
+        self.metrics = metrics
+        self.client = httpx.AsyncClient(
+            http1=not prior_knowledge, http2=True, verify=verify,
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit,
+                                keepalive_expiry=keepalive_s),
+        )
+
+    async def post(self, url, data, headers, timeout_s, trace_ctx):
+        ext = {}
+        if trace_ctx is not None:
+
+            async def trace(event: str, info: Dict[str, Any]) -> None:
+                # same "connect" stage as Metrics.trace_config: only attempts that opened a connection
+                if event == "connection.connect_tcp.started":
+                    trace_ctx["conn_t0"] = time.perf_counter()
+                elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                    trace_ctx["conn_t1"] = time.perf_counter()
+                elif event in ("http11.send_request_body.complete", "http2.send_request_body.complete"):
+                    trace_ctx["sent_t"] = time.time()
+
+            ext["trace"] = trace
+        try:
+            async with self.client.stream("POST", url, content=bytes(data), headers=headers,
+                                          timeout=timeout_s, extensions=ext) as resp:
+                t_headers = time.time()
+                body = await resp.aread()
+        except self._httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        if self.metrics is not None and trace_ctx and "conn_t1" in trace_ctx:
+            self.metrics.observe("connect", (trace_ctx["conn_t1"] - trace_ctx["conn_t0"]) * 1000)
+        return resp.status_code, resp.headers, body, t_headers
+
+    async def _get(self, url, headers):
+        await self.client.get(url, headers=headers, timeout=10)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+TRANSPORTS = ("aiohttp", "http2")
+
+
+def make_transport(args, limit: int, metrics: Optional["Metrics"] = None) -> Transport:
+    """--transport and its pool options -> a Transport for one endpoint."""
+    if args.transport == "http2":
+        return Http2Transport(limit, verify=not args.verify_false, metrics=metrics, keepalive_s=args.keepalive,
+                              prior_knowledge=all(u.startswith("http://") for u in args.url))
+    # --verify-false disables cert validation (TEST ONLY)
+    return AiohttpTransport(limit, ssl=False if args.verify_false else None,
+                            trace_configs=[metrics.trace_config()] if metrics is not None else None,
+                            dns_ttl_s=args.dns_ttl, keepalive_s=args.keepalive,
+                            limit_per_host=args.limit_per_host)
+
+
+def body_snippet(body: bytes, limit: int = 500) -> str:
+    """Error-path only: first `limit` chars of a response body as text."""
+    return body[: limit * 4].decode("utf-8", "replace")[:limit]
+
+
+async def send_payload(
+    transport: Transport,
     url: str,
     headers: Dict[str, str],
-    row: Dict[str, str],
+    payload: Dict[str, Any],
     timeout_s: int,
     retries: int,
     backoff_base_s: float,
+    limiter: Optional[AdaptiveLimiter] = None,
+    rate_limit: Optional[TokenBucket] = None,
+    metrics: Optional[Metrics] = None,
+    codec: JsonCodec = STDLIB_CODEC,
+    data: Optional[bytes] = None,
+    endpoints: Optional["EndpointPool"] = None,
 ) -> Dict[str, Any]:
-    external_member_id = (row.get("ExternalMemberID") or "").strip()
-    payload = build_payload(row)
-
+    """
+    POST one payload with retries for transient errors.
+    data: an already encoded body (e.g. a --spool record) sent as is
+    instead of encoding payload.
+    endpoints: several --url targets; each attempt picks its own endpoint
+    (transport and url are then ignored) and reports back to its health check.
+    Returns the final attempt's outcome:
+      { "status", "elapsed_ms", "body", "resp_json", "error"[, "retry_after"] }
+    body is the raw response bytes; error == "" means a 2xx response
+    (resp_json is then parsed).
+    """
+    prof = metrics is not None and metrics.profile
+    if data is None:
+        c0 = time.thread_time() if prof else 0.0
+        data = codec.dumps(payload)
+        if prof:
+            metrics.add_cpu("build", time.thread_time() - c0)
+    if "Content-Type" not in headers:
+        headers = {**headers, "Content-Type": "application/json"}
     last_error = ""
     for attempt in range(retries + 1):
+        if rate_limit is not None:
+            tw = time.perf_counter()
+            await rate_limit.acquire()
+            if metrics is not None:
+                metrics.observe("rate_wait", (time.perf_counter() - tw) * 1000)
+        trace_ctx = {} if metrics is not None else None
+        ep = None
+        if endpoints is not None:
+            ep = endpoints.pick()
+            transport, url = ep.transport, ep.url
         try:
             t0 = time.time()
-            async with session.post(url, json=payload, headers=headers, timeout=timeout_s) as resp:
-                status = resp.status
-                body_text = await resp.text()
-                elapsed_ms = int((time.time() - t0) * 1000)
-
-                # Non-2xx -> capture real reason
-                if not (200 <= status < 300):
-                    last_error = f"HTTP {status} body={body_text[:500]}"
-                    if status in (408, 429, 500, 502, 503, 504) and attempt < retries:
-                        await asyncio.sleep(backoff_base_s * (2 ** attempt) + random.uniform(0, 0.25))
-                        continue
-                    return {
-                        "ok": False,
-                        "ExternalMemberID": external_member_id,
-                        "httpStatus": status,
-                        "elapsed_ms": elapsed_ms,
-                        "returnedId": "",
-                        "error": last_error,
-                    }
-
-                # Try parse JSON
-                try:
-                    resp_json = json.loads(body_text)
-                except Exception:
-                    resp_json = {"raw": body_text}
-
-                returned_id = parse_returned_id(resp_json, external_member_id)
-                success_flag = resp_json.get("success") if isinstance(resp_json, dict) else None
-
-                # If API explicitly says success=false treat as failure
-                if success_flag is False:
-                    last_error = f"success=false body={body_text[:500]}"
-                    return {
-                        "ok": False,
-                        "ExternalMemberID": external_member_id,
-                        "httpStatus": status,
-                        "elapsed_ms": elapsed_ms,
-                        "returnedId": returned_id or "",
-                        "error": last_error,
-                    }
+            status, resp_headers, body, t_headers = await transport.post(url, data, headers, timeout_s, trace_ctx)
+            elapsed_ms = int((time.time() - t0) * 1000)
+            if ep is not None:
+                endpoints.release(ep, elapsed_ms, failed=status >= 500)
+                ep = None
+            if metrics is not None:
+                t_end = time.time()
+                metrics.observe("ttfb", (t_headers - trace_ctx.get("sent_t", t0)) * 1000)
+                metrics.observe("body", (t_end - t_headers) * 1000)
+                metrics.observe("total", (t_end - t0) * 1000)
+                metrics.attempt(f"http_{status}")
 
+            # Non-2xx -> capture real reason
+            if not (200 <= status < 300):
+                last_error = f"HTTP {status} body={body_snippet(body)}"
+                retry_after = parse_retry_after(resp_headers.get("Retry-After"))
+                if limiter is not None:
+                    limiter.observe(elapsed_ms, overloaded=status in (429, 503), retry_after_s=retry_after)
+                if status in RETRYABLE_STATUSES and attempt < retries:
+                    delay = backoff_base_s * (2 ** attempt) + random.uniform(0, 0.25)
+                    await asyncio.sleep(max(delay, retry_after or 0))
+                    continue
                 return {
-                    "ok": True,
-                    "ExternalMemberID": external_member_id,
-                    "httpStatus": status,
+                    "status": status,
                     "elapsed_ms": elapsed_ms,
-                    "returnedId": returned_id or "",
-                    "error": "",
+                    "body": body,
+                    "resp_json": None,
+                    "error": last_error,
+                    "retry_after": retry_after,
                 }
 
+            if limiter is not None:
+                limiter.observe(elapsed_ms)
+
+            # Try parse JSON
+            c0 = time.thread_time() if prof else 0.0
+            try:
+                resp_json = codec.loads(body)
+            except Exception:
+                resp_json = {"raw": body.decode("utf-8", "replace")}
+            if prof:
+                metrics.add_cpu("decode", time.thread_time() - c0)
+
+            return {
+                "status": status,
+                "elapsed_ms": elapsed_ms,
+                "body": body,
+                "resp_json": resp_json,
+                "error": "",
+            }
+
         except Exception as e:
             last_error = f"{type(e).__name__}: {e}"
+            if ep is not None:
+                endpoints.release(ep, None, failed=True)
+            if metrics is not None:
+                metrics.attempt(f"exc_{type(e).__name__}")
+            if limiter is not None and isinstance(e, asyncio.TimeoutError):
+                limiter.observe(None, overloaded=True)
             if attempt < retries:
                 await asyncio.sleep(backoff_base_s * (2 ** attempt) + random.uniform(0, 0.25))
                 continue
-            return {
-                "ok": False,
-                "ExternalMemberID": external_member_id,
-                "httpStatus": "",
-                "elapsed_ms": "",
-                "returnedId": "",
-                "error": last_error,
-            }
+            break
 
-    # Final safety return (never return None)
+    # Exceptions on every attempt (never return None)
     return {
-        "ok": False,
-        "ExternalMemberID": external_member_id,
-        "httpStatus": "",
+        "status": "",
         "elapsed_ms": "",
-        "returnedId": "",
+        "body": b"",
+        "resp_json": None,
         "error": last_error or "Unknown error",
     }
 
 
-async def run_all(args):
-    # Read CSV
-    with open(args.input, "r", newline="", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def is_retryable(res: Dict[str, Any]) -> bool:
+    """Transient failure: retryable HTTP status or an exception (no status)."""
+    return not res.get("ok") and (res.get("httpStatus") in RETRYABLE_STATUSES or res.get("httpStatus") == "")
+
+
+class RetryScheduler:
+    """
+    --deferred-retries: transient failures leave their concurrency slot and
+    wait in a heap keyed by next-attempt time; run() re-dispatches each one
+    as its own task when due. Healthy rows keep flowing meanwhile instead
+    of queueing behind slots spent in asyncio.sleep. len() is what's pending
+    (run_streaming counts it against its queue bound); an exception in a
+    re-dispatched task is raised from drain().
+    """
+
+    def __init__(self, dispatch):
+        self._dispatch = dispatch  # async (batch, attempt) -> None
+        self._heap: List[Tuple[float, int, List[Dict[str, str]], int]] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._inflight = set()
+        self._done_event = asyncio.Event()
+        self._errors: List[BaseException] = []
+
+    def __len__(self) -> int:
+        return len(self._heap) + len(self._inflight)
+
+    def schedule(self, batch: List[Dict[str, str]], attempt: int, delay_s: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay_s, self._seq, batch, attempt))
+        self._seq += 1
+        self._wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due = self._heap[0][0] - time.monotonic()
+            if due > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), due)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, batch, attempt = heapq.heappop(self._heap)
+            task = asyncio.create_task(self._dispatch(batch, attempt))
+            self._inflight.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._inflight.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._errors.append(task.exception())
+        self._done_event.set()
+
+    async def wait_progress(self) -> None:
+        """Wait until some re-dispatched retry finishes (or is rescheduled)."""
+        self._done_event.clear()
+        await self._done_event.wait()
+
+    def raise_errors(self) -> None:
+        if self._errors:
+            raise self._errors[0]
+
+    async def drain(self) -> None:
+        """Wait until nothing is scheduled or running (retries may reschedule)."""
+        while self._heap or self._inflight:
+            self.raise_errors()
+            if self._inflight:
+                await asyncio.wait(list(self._inflight), return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(max(self._heap[0][0] - time.monotonic(), 0.001))
+        self.raise_errors()
+
+
+class CircuitBreaker:
+    """
+    Pauses new dispatch when the recent error rate crosses `threshold`.
+    Looks at the last `window` request outcomes (transient failures count as
+    errors); once open, nothing is dispatched for `cooldown_s`, then it
+    half-opens with a fresh window.
+    """
+
+    def __init__(self, threshold: float, window: int = 100, cooldown_s: float = 5.0, min_samples: int = 20):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.min_samples = min_samples
+        self._outcomes = deque(maxlen=window)
+        self._errors = 0
+        self._open_until = 0.0
+        self.trips = 0
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self._open_until
+
+    def record(self, error: bool) -> None:
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._errors -= self._outcomes[0]
+        self._outcomes.append(error)
+        self._errors += error
+        if (not self.is_open and len(self._outcomes) >= self.min_samples
+                and self._errors / len(self._outcomes) >= self.threshold):
+            self._open_until = time.monotonic() + self.cooldown_s
+            self._outcomes.clear()
+            self._errors = 0
+            self.trips += 1
+
+    async def wait_closed(self) -> None:
+        while True:
+            delay = self._open_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+
+class Endpoint:
+    """One --url target: its own transport (connection pool) plus load and health state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.transport: Optional[Transport] = None
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.fail_streak = 0
+        self.ejected_until = 0.0
+        self.backoff = 0  # ejections since the last success
+        self.counts: Counter = Counter()  # attempts, errors (5xx/exceptions), ejections
+        self.latency = LatencyHistogram()
+
+
+class EndpointPool:
+    """
+    Client-side balancing over several --url endpoints, picked per attempt
+    (so an in-request retry can land on another node).
+
+    pick(): among endpoints that aren't ejected, the one with the fewest
+    requests outstanding, ties going to the lower latency EWMA; with
+    policy="latency", (outstanding + 1) x EWMA, so a slow node gets
+    proportionally less traffic. Passive health check: eject_after
+    consecutive 5xx/exceptions eject an endpoint for eject_s, doubling on
+    each repeat up to max_eject_s. Once back it is on probation - a single
+    failure ejects it again - until a success resets it. If every endpoint
+    is ejected, the one due back first is used rather than stalling.
+    """
+
+    POLICIES = ("least-outstanding", "latency")
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, urls: Sequence[str], policy: str = "least-outstanding", eject_after: int = 3,
+                 eject_s: float = 10.0, max_eject_s: float = 120.0):
+        self.endpoints = [Endpoint(u) for u in urls]
+        self.policy = policy
+        self.eject_after = max(eject_after, 1)
+        self.eject_s = eject_s
+        self.max_eject_s = max_eject_s
+
+    def pick(self) -> Endpoint:
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.ejected_until <= now]
+        if not healthy:
+            ep = min(self.endpoints, key=lambda e: e.ejected_until)
+        elif self.policy == "latency":
+            ep = min(healthy, key=lambda e: (e.outstanding + 1) * (e.ewma_ms or 1.0))
+        else:
+            ep = min(healthy, key=lambda e: (e.outstanding, e.ewma_ms or 0.0))
+        ep.outstanding += 1
+        ep.counts["attempts"] += 1
+        return ep
+
+    def release(self, ep: Endpoint, elapsed_ms: Optional[float], failed: bool) -> None:
+        """Attempt finished: elapsed_ms None for exceptions; failed = 5xx or exception."""
+        ep.outstanding -= 1
+        if elapsed_ms is not None:
+            ep.latency.record(elapsed_ms)
+            ep.ewma_ms = elapsed_ms if ep.ewma_ms is None else \
+                ep.ewma_ms + self.EWMA_ALPHA * (elapsed_ms - ep.ewma_ms)
+        if not failed:
+            ep.fail_streak = 0
+            ep.backoff = 0
+            return
+        ep.counts["errors"] += 1
+        ep.fail_streak += 1
+        if ep.fail_streak >= self.eject_after and ep.ejected_until <= time.monotonic():
+            ep.ejected_until = time.monotonic() + min(self.eject_s * 2 ** ep.backoff, self.max_eject_s)
+            ep.backoff += 1
+            ep.counts["ejections"] += 1
+            # probation: the first failure after it comes back ejects it again
+            ep.fail_streak = self.eject_after - 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {e.url: {"counts": dict(e.counts), "latency": e.latency.snapshot()} for e in self.endpoints}
+
+    def merge(self, snap: Dict[str, Any]) -> None:
+        """Add a --workers shard's snapshot() (same --url list)."""
+        by_url = {e.url: e for e in self.endpoints}
+        for url, s in snap.items():
+            by_url[url].counts.update(s["counts"])
+            by_url[url].latency.merge(s["latency"])
+
+
+async def post_one(
+    transport: Transport,
+    url: str,
+    headers: Dict[str, str],
+    row: Dict[str, str],
+    timeout_s: int,
+    retries: int,
+    backoff_base_s: float,
+    limiter: Optional[AdaptiveLimiter] = None,
+    idempotency_key: bool = False,
+    rate_limit: Optional[TokenBucket] = None,
+    metrics: Optional[Metrics] = None,
+    codec: JsonCodec = STDLIB_CODEC,
+    endpoints: Optional["EndpointPool"] = None,
+) -> Dict[str, Any]:
+    prof = metrics is not None and metrics.profile
+    c0 = time.thread_time() if prof else 0.0
+    external_member_id = (row.get("ExternalMemberID") or "").strip()
+    payload = build_payload(row)
+    if idempotency_key:
+        headers = {**headers, "Idempotency-Key": payload_hash(payload)}
+    if prof:
+        metrics.add_cpu("build", time.thread_time() - c0)
+
+    out = await send_payload(transport, url, headers, payload, timeout_s, retries, backoff_base_s,
+                             limiter, rate_limit, metrics, codec, endpoints=endpoints)
+    if not prof:
+        return single_result(out, external_member_id)
+    c0 = time.thread_time()
+    res = single_result(out, external_member_id)
+    metrics.add_cpu("decode", time.thread_time() - c0)
+    return res
+
+
+def single_result(out: Dict[str, Any], external_member_id: str) -> Dict[str, Any]:
+    """send_payload outcome -> result row for a one-note request."""
+    if out["error"]:
+        return {
+            "ok": False,
+            "ExternalMemberID": external_member_id,
+            "httpStatus": out["status"],
+            "elapsed_ms": out["elapsed_ms"],
+            "returnedId": "",
+            "error": out["error"],
+            "retryAfter": out.get("retry_after"),
+        }
+
+    resp_json = out["resp_json"]
+    returned_id = parse_returned_id(resp_json, external_member_id)
+    success_flag = resp_json.get("success") if isinstance(resp_json, dict) else None
+
+    # If API explicitly says success=false treat as failure
+    if success_flag is False:
+        return {
+            "ok": False,
+            "ExternalMemberID": external_member_id,
+            "httpStatus": out["status"],
+            "elapsed_ms": out["elapsed_ms"],
+            "returnedId": returned_id or "",
+            "error": f"success=false body={body_snippet(out['body'])}",
+        }
 
-    if not rows:
+    return {
+        "ok": True,
+        "ExternalMemberID": external_member_id,
+        "httpStatus": out["status"],
+        "elapsed_ms": out["elapsed_ms"],
+        "returnedId": returned_id or "",
+        "error": "",
+    }
+
+
+async def post_batch(
+    transport: Transport,
+    url: str,
+    headers: Dict[str, str],
+    rows: List[Dict[str, str]],
+    timeout_s: int,
+    retries: int,
+    backoff_base_s: float,
+    limiter: Optional[AdaptiveLimiter] = None,
+    idempotency_key: bool = False,
+    rate_limit: Optional[TokenBucket] = None,
+    metrics: Optional[Metrics] = None,
+    codec: JsonCodec = STDLIB_CODEC,
+    endpoints: Optional["EndpointPool"] = None,
+) -> List[Dict[str, Any]]:
+    """
+    One POST for several rows (same VisibleID), fanned back out into one
+    result per row using the per-member `data` map of the response.
+    With success=false, rows the API still returned an id for count as ok.
+    """
+    prof = metrics is not None and metrics.profile
+    c0 = time.thread_time() if prof else 0.0
+    member_ids = [(r.get("ExternalMemberID") or "").strip() for r in rows]
+    payload = build_batch_payload(rows)
+    if idempotency_key:
+        headers = {**headers, "Idempotency-Key": payload_hash(payload)}
+    if prof:
+        metrics.add_cpu("build", time.thread_time() - c0)
+
+    out = await send_payload(transport, url, headers, payload, timeout_s, retries, backoff_base_s,
+                             limiter, rate_limit, metrics, codec, endpoints=endpoints)
+    if not prof:
+        return batch_results(out, member_ids)
+    c0 = time.thread_time()
+    results = batch_results(out, member_ids)
+    metrics.add_cpu("decode", time.thread_time() - c0)
+    return results
+
+
+def batch_results(out: Dict[str, Any], member_ids: List[str]) -> List[Dict[str, Any]]:
+    """send_payload outcome -> one result row per note of a batch request."""
+    if out["error"]:
+        return [
+            {
+                "ok": False,
+                "ExternalMemberID": mid,
+                "httpStatus": out["status"],
+                "elapsed_ms": out["elapsed_ms"],
+                "returnedId": "",
+                "error": out["error"],
+                "retryAfter": out.get("retry_after"),
+            }
+            for mid in member_ids
+        ]
+
+    resp_json = out["resp_json"]
+    success_flag = resp_json.get("success") if isinstance(resp_json, dict) else None
+
+    results = []
+    seen: Dict[str, int] = {}
+    for mid in member_ids:
+        # same member twice in one batch -> its ids come back in note order
+        idx = seen.get(mid, 0)
+        seen[mid] = idx + 1
+        returned_id = parse_returned_id(resp_json, mid, idx)
+        ok = success_flag is not False or bool(returned_id)
+        results.append({
+            "ok": ok,
+            "ExternalMemberID": mid,
+            "httpStatus": out["status"],
+            "elapsed_ms": out["elapsed_ms"],
+            "returnedId": returned_id or "",
+            "error": "" if ok else f"success=false body={body_snippet(out['body'])}",
+        })
+    return results
+
+
+async def post_compiled(
+    transport: Transport,
+    url: str,
+    headers: Dict[str, str],
+    rec: "SpoolRecord",
+    timeout_s: int,
+    retries: int,
+    backoff_base_s: float,
+    limiter: Optional[AdaptiveLimiter] = None,
+    idempotency_key: bool = False,
+    rate_limit: Optional[TokenBucket] = None,
+    metrics: Optional[Metrics] = None,
+    codec: JsonCodec = STDLIB_CODEC,
+    endpoints: Optional["EndpointPool"] = None,
+) -> List[Dict[str, Any]]:
+    """post_one / post_batch for a --spool record: the body is sent straight from the mmap."""
+    if idempotency_key:
+        headers = {**headers, "Idempotency-Key": rec.key}
+    out = await send_payload(transport, url, headers, None, timeout_s, retries, backoff_base_s,
+                             limiter, rate_limit, metrics, codec, data=rec.body,
+                             endpoints=endpoints)
+    c0 = time.thread_time()
+    if len(rec.member_ids) == 1:
+        results = [single_result(out, rec.member_ids[0])]
+    else:
+        results = batch_results(out, rec.member_ids)
+    if metrics is not None and metrics.profile:
+        metrics.add_cpu("decode", time.thread_time() - c0)
+    return results
+
+
+def iter_batches(rows: Iterable[Dict[str, str]], batch_size: int) -> Iterator[List[Dict[str, str]]]:
+    """
+    Group rows sharing a VisibleID into lists of up to batch_size.
+    Full groups are yielded as soon as they fill, leftovers at the end, so in
+    --stream mode at most (distinct VisibleIDs x batch_size) rows are held.
+    """
+    if batch_size <= 1:
+        for r in rows:
+            yield [r]
+        return
+
+    pending: Dict[str, List[Dict[str, str]]] = {}
+    for r in rows:
+        key = (r.get("VisibleID") or "").strip()
+        buf = pending.setdefault(key, [])
+        buf.append(r)
+        if len(buf) >= batch_size:
+            del pending[key]
+            yield buf
+    yield from pending.values()
+
+
+# Input row number (0-based, header excluded), set by read_rows. Lets results
+# be tied back to a stable position in the file for the checkpoint journal.
+ROW_NO = "_row_no"
+PAYLOAD_HASH = "_payload_hash"
+
+
+def number_rows(rows: Iterable[Dict[str, str]], first_row: int = 0) -> Iterator[Dict[str, str]]:
+    for i, r in enumerate(rows, first_row):
+        r[ROW_NO] = i
+        yield r
+
+
+def read_rows(
+    path: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    fieldnames: Optional[List[str]] = None,
+    first_row: int = 0,
+) -> Iterator[Dict[str, str]]:
+    """
+    Yield input rows tagged with ROW_NO.
+    With a byte range (a --workers shard from plan_shards) only records in
+    [start, end) are read; the header isn't in the range, so fieldnames and
+    the shard's first row number must be given.
+    """
+    if end is None:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            yield from number_rows(csv.DictReader(f))
+        return
+
+    with open(path, "rb") as f:
+        f.seek(start)
+
+        def lines():
+            # end is record-aligned, so the record that starts last ends exactly at end
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    return
+                yield line.decode("utf-8")
+
+        yield from number_rows(csv.DictReader(lines(), fieldnames=fieldnames), first_row)
+
+
+def plan_shards(path: str, n: int) -> Tuple[List[str], List[Dict[str, int]]]:
+    """
+    Split the input into n byte ranges aligned to CSV record boundaries.
+    One binary pass tracking quote parity (RFC 4180 escapes "" keep parity),
+    so a newline inside a quoted NoteText is never taken as a boundary.
+    Returns (fieldnames, [{"start", "end", "first_row", "rows"}, ...]).
+    Assumes a single-line header.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        data_start = f.tell()
+        fieldnames = next(csv.reader([header.decode("utf-8-sig")]))
+
+        targets = [data_start + (size - data_start) * i // n for i in range(1, n)]
+        bounds = []  # (offset, first row number) of each shard after the first
+        ti = 0
+        records = 0
+        in_quotes = False
+        pos = data_start
+        last = b""
+        while True:
+            chunk = f.read(1 << 22)
+            if not chunk:
+                break
+            seg_start = pos
+            for j, seg in enumerate(chunk.split(b'"')):
+                if j:
+                    in_quotes = not in_quotes
+                    seg_start += 1  # the quote itself
+                if not in_quotes:
+                    # every newline here ends a record
+                    while ti < len(targets):
+                        rel = max(targets[ti] - seg_start, 0)
+                        k = seg.find(b"\n", rel) if rel <= len(seg) else -1
+                        if k < 0:
+                            break
+                        bounds.append((seg_start + k + 1, records + seg.count(b"\n", 0, k) + 1))
+                        ti += 1
+                    records += seg.count(b"\n")
+                seg_start += len(seg)
+            pos += len(chunk)
+            last = chunk[-1:]
+        if last and last != b"\n":
+            records += 1  # last record without trailing newline
+
+    starts = [(data_start, 0)] + [b for b in bounds if b[0] < size]
+    shards = []
+    for start, first_row in starts:
+        if shards and start == shards[-1]["start"]:
+            continue  # several targets landed on the same boundary
+        shards.append({"start": start, "first_row": first_row})
+    for i, sh in enumerate(shards):
+        nxt = shards[i + 1] if i + 1 < len(shards) else None
+        sh["end"] = nxt["start"] if nxt else size
+        sh["rows"] = (nxt["first_row"] if nxt else records) - sh["first_row"]
+    return fieldnames, shards
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Stable hash of a request body (key order / whitespace independent)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def row_payload_hash(row: Dict[str, str]) -> str:
+    """payload_hash(build_payload(row)), computed once and cached on the row."""
+    h = row.get(PAYLOAD_HASH)
+    if h is None:
+        h = row[PAYLOAD_HASH] = payload_hash(build_payload(row))
+    return h
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over payload hashes for --dedup bloom.
+    ~capacity * 1.8 bytes at fp_rate=1e-6 (vs ~100 bytes/entry for a set).
+    A false positive means a unique row is skipped as a duplicate and not
+    sent. Bloom hits are written to the duplicates file with
+    match=probable, so they can be checked and re-sent by row number.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = 1e-6):
+        capacity = max(capacity, 1)
+        self.m = max(8, math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.k = max(1, round(self.m / capacity * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def add(self, hexdigest: str) -> bool:
+        """Add; True if it was (probably) already present."""
+        # double hashing from two 64-bit slices of the sha1 hex digest
+        h1 = int(hexdigest[:16], 16)
+        h2 = int(hexdigest[16:32], 16) | 1
+        present = True
+        for i in range(self.k):
+            pos = (h1 + i * h2) % self.m
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        return present
+
+
+class ExactSeen:
+    """Exact --dedup: set of 64-bit prefixes of the payload hash."""
+
+    def __init__(self):
+        self.seen = set()
+
+    def add(self, hexdigest: str) -> bool:
+        key = int(hexdigest[:16], 16)
+        if key in self.seen:
+            return True
+        self.seen.add(key)
+        return False
+
+
+def dedup_rows(rows: Iterable[Dict[str, str]], seen, on_dup) -> Iterator[Dict[str, str]]:
+    """Drop rows whose build_payload output was already seen in this run."""
+    for r in rows:
+        if seen.add(row_payload_hash(r)):
+            on_dup(r)
+            continue
+        yield r
+
+
+class CheckpointJournal:
+    """
+    Durable record of succeeded rows for --resume (local SQLite file).
+    One row per success keyed by input row number, with ExternalMemberID and
+    the payload hash so an edited input row is re-sent instead of skipped.
+    Writes are batched and committed with synchronous=FULL (fsync), so a
+    crash loses at most the last `commit_every` successes - those get
+    re-sent on resume.
+    """
+
+    def __init__(self, path: str, commit_every: int = 500):
+        self.path = path
+        self.commit_every = commit_every
+        # --workers shards share one journal file, hence the busy timeout
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS succeeded ("
+            " row_no INTEGER PRIMARY KEY,"
+            " member_id TEXT NOT NULL,"
+            " payload_hash TEXT NOT NULL,"
+            " returned_id TEXT,"
+            " ts REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self._pending = []
+
+    def add(self, row: Dict[str, str], res: Dict[str, Any]) -> None:
+        if not res.get("ok"):
+            return
+        self._pending.append((
+            row[ROW_NO],
+            res.get("ExternalMemberID", ""),
+            row_payload_hash(row),
+            res.get("returnedId", ""),
+            time.time(),
+        ))
+        if len(self._pending) >= self.commit_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            self.conn.executemany("INSERT OR REPLACE INTO succeeded VALUES (?, ?, ?, ?, ?)", self._pending)
+            self.conn.commit()
+            self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+    def skip_done(self, rows: Iterable[Dict[str, str]], on_skip, chunk: int = 10000) -> Iterator[Dict[str, str]]:
+        """
+        Yield only rows not already journaled as succeeded.
+        Input rows arrive in row_no order, so this is a merge against the
+        journal's primary key read in chunks: O(1) per row, no startup scan
+        and nothing loaded up front.
+        """
+        reader = sqlite3.connect(self.path, timeout=60)
+        try:
+            buf = []
+            pos = 0
+            next_from = 0
+            exhausted = False
+            for r in rows:
+                n = r[ROW_NO]
+                while True:
+                    while pos < len(buf) and buf[pos][0] < n:
+                        pos += 1
+                    if pos < len(buf) or exhausted:
+                        break
+                    buf = reader.execute(
+                        "SELECT row_no, member_id, payload_hash FROM succeeded"
+                        " WHERE row_no >= ? ORDER BY row_no LIMIT ?",
+                        (max(n, next_from), chunk),
+                    ).fetchall()
+                    pos = 0
+                    if len(buf) < chunk:
+                        exhausted = True
+                    if buf:
+                        next_from = buf[-1][0] + 1
+
+                if pos < len(buf) and buf[pos][0] == n:
+                    _, member_id, h = buf[pos]
+                    if member_id == (r.get("ExternalMemberID") or "").strip() and h == row_payload_hash(r):
+                        on_skip(r)
+                        continue
+                yield r
+        finally:
+            reader.close()
+
+
+class ResultSink:
+    """
+    Buffered writer for one output file (success / failed / duplicates).
+    write() only appends a tuple to an in-memory batch; every `flush_rows`
+    rows the batch is handed to `executor` (one shared writer thread keeps
+    per-file order) so the event loop never waits on disk. At most
+    `max_pending` batches are queued - beyond that write() waits for the
+    oldest, which bounds memory if the disk can't keep up.
+
+    fmt: csv (default), jsonl, or parquet (needs pyarrow; one row group per
+    batch, no append).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fields: Sequence[str],
+        executor: ThreadPoolExecutor,
+        fmt: str = "csv",
+        append: bool = False,
+        flush_rows: int = 1000,
+        max_pending: int = 4,
+    ):
+        self.path = path
+        self.fields = list(fields)
+        self.fmt = fmt
+        self.flush_rows = max(flush_rows, 1)
+        self.max_pending = max(max_pending, 1)
+        self._executor = executor
+        self._buf: List[Tuple] = []
+        self._pending: deque = deque()
+        self._pq_writer = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if fmt == "parquet":
+            if append:
+                raise ValueError("parquet output can't be appended to; use csv or jsonl with --resume")
+            import pyarrow as pa  # optional dependency, only for --out-format parquet
+            import pyarrow.parquet as pq
+            self._pa = pa
+            self._pq = pq
+            self._f = None
+        else:
+            self._f = open(path, "a" if append else "w", newline="", encoding="utf-8")
+            if fmt == "csv":
+                self._csv = csv.writer(self._f)
+                if self._f.tell() == 0:
+                    self._csv.writerow(self.fields)
+
+    def write(self, values: Tuple) -> None:
+        self._buf.append(values)
+        if len(self._buf) >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buf:
+            batch, self._buf = self._buf, []
+            self._pending.append(self._executor.submit(self._write_batch, batch))
+        while self._pending and (self._pending[0].done() or len(self._pending) > self.max_pending):
+            self._pending.popleft().result()  # re-raises writer errors
+
+    def close(self) -> None:
+        self.flush()
+        while self._pending:
+            self._pending.popleft().result()
+        done: Future = self._executor.submit(self._close_file)
+        done.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # --- writer thread only below ---
+
+    def _write_batch(self, batch: List[Tuple]) -> None:
+        if self.fmt == "csv":
+            self._csv.writerows(batch)
+        elif self.fmt == "jsonl":
+            self._f.write("".join(json.dumps(dict(zip(self.fields, v)), ensure_ascii=False) + "\n" for v in batch))
+        else:
+            cols = {name: ["" if v[i] is None else str(v[i]) for v in batch] for i, name in enumerate(self.fields)}
+            table = self._pa.table(cols)
+            if self._pq_writer is None:
+                self._pq_writer = self._pq.ParquetWriter(self.path, table.schema)
+            self._pq_writer.write_table(table)
+
+    def _close_file(self) -> None:
+        if self._f is not None:
+            self._f.close()
+        if self._pq_writer is not None:
+            self._pq_writer.close()
+        elif self.fmt == "parquet":
+            # no rows at all: still leave a valid, empty file behind
+            schema = self._pa.schema([(name, self._pa.string()) for name in self.fields])
+            self._pq.write_table(schema.empty_table(), self.path)
+
+
+def count_rows_fast(path: str) -> int:
+    """
+    Cheap row count for progress/ETA in --stream mode.
+    Counts newlines in binary chunks (header excluded) without parsing CSV,
+    so quoted NoteText with embedded newlines makes it a slight over-count.
+    """
+    lines = 0
+    last = b""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last and last != b"\n":
+        lines += 1  # last line without trailing newline
+    return max(lines - 1, 0)
+
+
+# Spool file (--compile-spool / --spool), little-endian:
+#   header  MAGIC, u64 index offset, u64 records, u64 rows
+#   record  u32 body length, u16 rows, 20-byte payload sha1 (Idempotency-Key),
+#           per row: u32 row_no, u16 member id length, member id (utf-8);
+#           then the encoded request body
+#   index   u64 record offset per record, ascending
+# A record is one request (several rows with --batch-size), so a replay of
+# failures is just a list of record offsets - for records where every row
+# failed. Replaying a partly successful batch would resend (and duplicate)
+# its successful notes, so its failed rows are listed by row number instead.
+SPOOL_MAGIC = b"NOTESPL1"
+_SPOOL_HEADER = struct.Struct("<QQQ")
+_SPOOL_RECORD = struct.Struct("<IH20s")
+_SPOOL_ROW = struct.Struct("<IH")
+SPOOL_REQUIRED = ("ExternalMemberID", "VisibleID")
+
+
+class SpoolWriter:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._f = open(path, "wb")
+        self._f.write(SPOOL_MAGIC + _SPOOL_HEADER.pack(0, 0, 0))
+        self._offsets = array("Q")
+        self.records = 0
+        self.rows = 0
+
+    def add(self, body: bytes, rows: List[Tuple[int, str]], digest: bytes) -> int:
+        offset = self._f.tell()
+        parts = [_SPOOL_RECORD.pack(len(body), len(rows), digest)]
+        for row_no, member_id in rows:
+            mid = member_id.encode("utf-8")
+            parts.append(_SPOOL_ROW.pack(row_no, len(mid)))
+            parts.append(mid)
+        parts.append(body)
+        self._f.write(b"".join(parts))
+        self._offsets.append(offset)
+        self.records += 1
+        self.rows += len(rows)
+        return offset
+
+    def close(self) -> None:
+        index_offset = self._f.tell()
+        self._f.write(self._offsets.tobytes())
+        self._f.seek(len(SPOOL_MAGIC))
+        self._f.write(_SPOOL_HEADER.pack(index_offset, len(self._offsets), self.rows))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SpoolRecord:
+    __slots__ = ("offset", "row_nos", "member_ids", "key", "body")
+
+    def __init__(self, offset: int, row_nos: List[int], member_ids: List[str], key: str, body: memoryview):
+        self.offset = offset
+        self.row_nos = row_nos
+        self.member_ids = member_ids
+        self.key = key
+        self.body = body
+
+
+class Spool:
+    """Read side: the whole file is mmapped, bodies are memoryview slices of it (no copy)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(SPOOL_MAGIC)] != SPOOL_MAGIC:
+            raise ValueError(f"{path} is not a spool file (run --compile-spool first)")
+        index_offset, self.records, self.rows = _SPOOL_HEADER.unpack_from(self._mm, len(SPOOL_MAGIC))
+        self._view = memoryview(self._mm)
+        self.index = self._view[index_offset:index_offset + 8 * self.records].cast("Q")
+
+    def record(self, offset: int) -> SpoolRecord:
+        body_len, n, digest = _SPOOL_RECORD.unpack_from(self._mm, offset)
+        pos = offset + _SPOOL_RECORD.size
+        row_nos, member_ids = [], []
+        for _ in range(n):
+            row_no, mid_len = _SPOOL_ROW.unpack_from(self._mm, pos)
+            pos += _SPOOL_ROW.size
+            row_nos.append(row_no)
+            member_ids.append(self._mm[pos:pos + mid_len].decode("utf-8"))
+            pos += mid_len
+        return SpoolRecord(offset, row_nos, member_ids, digest.hex(), self._view[pos:pos + body_len])
+
+    def load_offsets(self, path: str) -> List[int]:
+        """Replay list: one record offset per line; offsets not in the index are rejected."""
+        offsets = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                off = int(line)
+                i = bisect.bisect_left(self.index, off)
+                if i == len(self.index) or self.index[i] != off:
+                    raise ValueError(f"{path}: {off} is not a record offset of {self.path}")
+                offsets.append(off)
+        return offsets
+
+    def count_rows(self, offsets: Iterable[int]) -> int:
+        return sum(_SPOOL_RECORD.unpack_from(self._mm, off)[1] for off in offsets)
+
+    def iter_records(self, offsets: Optional[Iterable[int]] = None) -> Iterator[SpoolRecord]:
+        for off in (self.index if offsets is None else offsets):
+            yield self.record(off)
+
+    def close(self) -> None:
+        self.index.release()
+        try:
+            self._view.release()
+            self._mm.close()
+        except BufferError:
+            pass  # a body view is still referenced somewhere; the mapping goes with it
+        self._f.close()
+
+
+def compile_spool(args) -> None:
+    """
+    --compile-spool: validate the input once and write every request body
+    (grouped by --batch-size) into a spool, so reruns skip CSV parsing and
+    payload building. Rows missing ExternalMemberID or VisibleID go to
+    <spool>.rejects.csv instead. --dedup and --journal/--resume filter rows
+    here, as run_all would, since a spool can't be filtered when sent.
+    """
+    codec = get_codec(args.json_codec)
+    started = time.time()
+    rejects_path = args.compile_spool + ".rejects.csv"
+    rejected = skipped = dupc = 0
+    writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-sink")
+    dw = None
+    with open(rejects_path, "w", newline="", encoding="utf-8") as rf, SpoolWriter(args.compile_spool) as sw:
+        rejects = csv.writer(rf)
+        rejects.writerow(["row", "ExternalMemberID", "VisibleID", "error"])
+
+        def valid_rows() -> Iterator[Dict[str, str]]:
+            nonlocal rejected
+            for r in read_rows(args.input):
+                missing = [c for c in SPOOL_REQUIRED if not (r.get(c) or "").strip()]
+                if missing:
+                    rejected += 1
+                    rejects.writerow([r[ROW_NO], r.get("ExternalMemberID") or "", r.get("VisibleID") or "",
+                                      "missing " + ", ".join(missing)])
+                    continue
+                yield r
+
+        rows = valid_rows()
+        if args.dedup != "off":
+            if args.dedup == "bloom":
+                dedup_seen = BloomFilter(args.dedup_capacity or count_rows_fast(args.input), args.dedup_fp_rate)
+            else:
+                dedup_seen = ExactSeen()
+            dw = ResultSink(args.out_duplicates, ["row", "ExternalMemberID", "VisibleID", "payloadHash", "match"],
+                            executor=writer_pool, fmt=args.out_format, flush_rows=args.flush_rows)
+            match = "probable" if args.dedup == "bloom" else "exact"
+
+            def on_dup(row: Dict[str, str]) -> None:
+                nonlocal dupc
+                dupc += 1
+                dw.write((row[ROW_NO], (row.get("ExternalMemberID") or "").strip(),
+                          (row.get("VisibleID") or "").strip(), row[PAYLOAD_HASH], match))
+
+            rows = dedup_rows(rows, dedup_seen, on_dup)
+
+        if args.resume:
+            def on_skip(row: Dict[str, str]) -> None:
+                nonlocal skipped
+                skipped += 1
+
+            journal = CheckpointJournal(args.journal)
+            rows = journal.skip_done(rows, on_skip)
+
+        for batch in iter_batches(rows, args.batch_size):
+            payload = build_payload(batch[0]) if len(batch) == 1 else build_batch_payload(batch)
+            sw.add(
+                codec.dumps(payload),
+                [(r[ROW_NO], (r.get("ExternalMemberID") or "").strip()) for r in batch],
+                bytes.fromhex(payload_hash(payload)),
+            )
+    if dw is not None:
+        dw.close()
+    if args.resume:
+        journal.close()
+    writer_pool.shutdown()
+    size = os.path.getsize(args.compile_spool)
+    print(f"spool: {sw.rows} rows in {sw.records} requests, {size / 1e6:.1f} MB -> {args.compile_spool} "
+          f"({time.time() - started:.1f}s)")
+    print(f"rejected: {rejected}" + (f" -> {rejects_path}" if rejected else ""))
+    if dw is not None:
+        print(f"dup: {dupc} -> {args.out_duplicates}")
+    if args.resume:
+        print(f"skipped (journal): {skipped}")
+
+
+async def run_all(args, shard: Optional[Dict[str, Any]] = None, source=None):
+    """
+    source: optional (rows iterable, expected total) to post rows produced by
+    another tool (e.g. medicaid_matcher.py) instead of reading args.input.
+    Rows need the ExternalMemberID / VisibleID / NoteText keys.
+    """
+    # --profile: CPU of this (event loop) thread and the whole process over the run
+    wall0, cpu0, proc0 = time.time(), time.thread_time(), time.process_time()
+    spool = None
+    if args.spool:
+        # compiled bodies: no CSV, no payload building; --spool-offsets replays a subset
+        spool = Spool(args.spool)
+        offsets = spool.load_offsets(args.spool_offsets) if args.spool_offsets else None
+        total = spool.rows if offsets is None else spool.count_rows(offsets)
+        rows = None
+    elif source is not None:
+        src_rows, total = source
+        total = max(total, 1)  # only an estimate, used for progress/ETA
+        rows = number_rows(src_rows)
+    elif shard is not None:
+        # --workers child: stream just this byte range, row count is exact
+        total = shard["rows"]
+        rows = read_rows(args.input, shard["start"], shard["end"], shard["fieldnames"], shard["first_row"])
+    elif args.stream:
+        # Streaming: rows are read lazily, only count lines for progress
+        total = count_rows_fast(args.input)
+        rows = read_rows(args.input)
+    else:
+        # Read CSV
+        rows = list(read_rows(args.input))
+        total = len(rows)
+    read_cpu = time.thread_time() - cpu0
+
+    if not total:
         print("No rows found in input CSV.")
+        if spool is not None:
+            spool.close()
         return
 
     # Ensure output dirs exist
@@ -167,93 +1839,613 @@ async def run_all(args):
     if args.token:
         headers["Authorization"] = f"Bearer {args.token}"
 
-    # SSL handling: --verify-false disables cert validation (TEST ONLY)
-    ssl_param = False if args.verify_false else None
+    limiter = None
+    max_in_flight = args.concurrency
+    if args.adaptive:
+        # --concurrency is the starting window, the limiter moves it
+        max_in_flight = args.max_concurrency or args.concurrency * 4
+        limiter = AdaptiveLimiter(
+            initial=args.concurrency,
+            min_window=args.min_concurrency,
+            max_window=max_in_flight,
+            target_p95_ms=args.target_p95_ms,
+            target_p50_ms=args.target_p50_ms,
+        )
+        slot = limiter
+    else:
+        slot = asyncio.Semaphore(args.concurrency)
+
+    rate_limit = None
+    if args.max_rps:
+        rate_limit = TokenBucket(args.max_rps, args.burst or max(1, math.ceil(args.max_rps)))
+
+    codec = get_codec(args.json_codec)
+
+    metrics = Metrics(profile=args.profile) if (args.metrics_port or args.metrics_json or args.profile) else None
+    if args.profile:
+        # up-front read (and spool open / row count) happened before metrics existed
+        metrics.add_cpu("read", read_cpu)
+    metrics_runner = None
+    if metrics is not None and args.metrics_port:
+        # --workers: shard i serves on metrics_port + i
+        port = args.metrics_port + (shard["index"] if shard is not None else 0)
+        metrics_runner = await metrics.serve(port)
+        if shard is None:
+            print(f"metrics: http://127.0.0.1:{port}/metrics")
 
-    connector = aiohttp.TCPConnector(ssl=ssl_param, limit=args.concurrency)
-    sem = asyncio.Semaphore(args.concurrency)
+    # several --url: one connection pool per endpoint behind a client-side balancer
+    endpoints = None
+    if len(args.url) > 1:
+        endpoints = EndpointPool(args.url, args.lb, args.eject_after, args.eject_seconds)
 
     success_fields = ["ExternalMemberID", "httpStatus", "elapsed_ms", "returnedId"]
     failed_fields = ["ExternalMemberID", "httpStatus", "elapsed_ms", "error"]
 
-    with open(args.out_success, "w", newline="", encoding="utf-8") as sf, \
-         open(args.out_failed, "w", newline="", encoding="utf-8") as ff:
+    journal = CheckpointJournal(args.journal) if args.journal else None
 
-        sw = csv.DictWriter(sf, fieldnames=success_fields)
-        fw = csv.DictWriter(ff, fieldnames=failed_fields)
-        sw.writeheader()
-        fw.writeheader()
+    # --resume appends to the previous run's outputs instead of truncating them
+    writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="result-sink")
+    sink_opts = dict(executor=writer_pool, fmt=args.out_format, flush_rows=args.flush_rows)
+
+    with ResultSink(args.out_success, success_fields, append=args.resume, **sink_opts) as sw, \
+         ResultSink(args.out_failed, failed_fields, append=args.resume, **sink_opts) as fw:
 
         started = time.time()
-        done = okc = failc = 0
+        done = okc = failc = skipped = dupc = 0
+
+        def on_skip(row: Dict[str, str]) -> None:
+            nonlocal skipped
+            skipped += 1
+
+        # Dedup runs before the resume filter so rows skipped as already
+        # sent still mark their payload as seen
+        dw = None
+        if args.dedup != "off":
+            if args.dedup == "bloom":
+                dedup_seen = BloomFilter(args.dedup_capacity or total, args.dedup_fp_rate)
+            else:
+                dedup_seen = ExactSeen()
+            # always rewritten: a resumed run re-detects every duplicate anyway
+            dw = ResultSink(args.out_duplicates, ["row", "ExternalMemberID", "VisibleID", "payloadHash", "match"],
+                            **sink_opts)
+            # a bloom hit may be a false positive: keep it distinguishable from a certain duplicate
+            match = "probable" if args.dedup == "bloom" else "exact"
+
+            def on_dup(row: Dict[str, str]) -> None:
+                nonlocal dupc
+                dupc += 1
+                dw.write((
+                    row[ROW_NO],
+                    (row.get("ExternalMemberID") or "").strip(),
+                    (row.get("VisibleID") or "").strip(),
+                    row[PAYLOAD_HASH],
+                    match,
+                ))
+
+            rows = dedup_rows(rows, dedup_seen, on_dup)
+
+        if journal is not None and args.resume:
+            rows = journal.skip_done(rows, on_skip)
 
-        async with aiohttp.ClientSession(connector=connector) as session:
+        # --spool: offsets of records with failed rows, ready for --spool-offsets
+        replay_f = partial_w = None
+        if spool is not None:
+            replay_path = args.out_replay or args.out_failed + ".offsets"
+            replay_f = open(replay_path, "w", encoding="utf-8")
+            # failed rows of partly successful records: not replayable by offset
+            partial_f = open(replay_path + ".partial.csv", "w", newline="", encoding="utf-8")
+            partial_w = csv.writer(partial_f)
+            partial_w.writerow(["row", "ExternalMemberID", "offset"])
 
-            async def bound_call(r):
-                async with sem:
-                    return await post_one(
-                        session=session,
-                        url=args.url,
+        def record(res: Dict[str, Any], row: Dict[str, str]) -> None:
+            nonlocal done, okc, failc
+            done += 1
+            if journal is not None:
+                journal.add(row, res)
+            if metrics is not None:
+                metrics.result(res)
+
+            if res.get("ok"):
+                okc += 1
+                sw.write((res["ExternalMemberID"], res["httpStatus"], res["elapsed_ms"], res["returnedId"]))
+            else:
+                failc += 1
+                fw.write((res["ExternalMemberID"], res["httpStatus"], res["elapsed_ms"], res["error"]))
+
+            # ✅ Progress print with % + elapsed + ETA
+            # (in --stream mode total is a line-count estimate, so clamp;
+            # rows skipped by --resume count as done but not towards rps)
+            seen = done + skipped + dupc
+            if shard is not None:
+                # the parent aggregates and prints progress for all shards
+                if done % args.print_every == 0 or seen == total:
+                    shard["queue"].put(("progress", shard["index"], (seen, okc, failc, skipped, dupc)))
+                return
+            if done % args.print_every == 0 or seen == total:
+                elapsed = time.time() - started
+                percent = min(seen / total, 1.0) * 100
+                rps = done / elapsed if elapsed else 0
+
+                remaining = max(total - seen, 0)
+                eta_sec = remaining / rps if rps > 0 else 0
+
+                print(
+                    f"Progress: {seen}/{total} "
+                    f"({percent:.1f}%) | "
+                    f"ok={okc} fail={failc}"
+                    + (f" skipped={skipped}" if skipped else "")
+                    + (f" dup={dupc}" if dupc else "")
+                    + " | "
+                    f"elapsed={elapsed/60:.1f} min | "
+                    f"ETA={eta_sec/60:.1f} min"
+                    + (f" | window={limiter.limit} in_flight={limiter.in_flight}" if limiter else "")
+                    + (f" | retry_q={len(scheduler)}" if scheduler is not None else "")
+                    + (" | breaker=OPEN" if breaker is not None and breaker.is_open else "")
+                )
+
+        if args.profile:
+            _record = record
+
+            def record(res: Dict[str, Any], row: Dict[str, str]) -> None:
+                c0 = time.thread_time()
+                _record(res, row)
+                metrics.add_cpu("record", time.thread_time() - c0)
+
+        # --deferred-retries: send_payload makes a single attempt and
+        # transient failures go to the scheduler instead of sleeping in-slot
+        send_retries = 0 if args.deferred_retries else args.retries
+        scheduler: Optional[RetryScheduler] = None
+        breaker = CircuitBreaker(args.breaker_threshold, args.breaker_window, args.breaker_cooldown) \
+            if args.breaker_threshold else None
+
+        async with contextlib.AsyncExitStack() as stack:
+            transport = None
+            for ep in endpoints.endpoints if endpoints is not None else [None]:
+                transport = make_transport(args, max_in_flight, metrics)
+                stack.push_async_callback(transport.close)
+                if ep is not None:
+                    ep.transport = transport
+
+            # --warm-up: open keep-alive connections before the first row instead of during it
+            if args.warm_up > 0:
+                tw = time.time()
+                warm_up = min(args.warm_up, max_in_flight)
+                targets = [(ep.transport, ep.url) for ep in endpoints.endpoints] if endpoints is not None \
+                    else [(transport, args.url[0])]
+                warmed = await asyncio.gather(*(t.warm_up(urljoin(u, args.warm_up_url), warm_up, headers)
+                                                for t, u in targets))
+                if shard is None:
+                    print(f"warm-up: {sum(warmed)}/{len(targets) * warm_up} requests "
+                          f"in {(time.time() - tw) * 1000:.0f}ms ({transport.name})")
+
+            async def bound_call(batch):
+                if breaker is not None:
+                    await breaker.wait_closed()
+                tq = time.perf_counter()
+                async with slot:
+                    if metrics is not None:
+                        metrics.observe("queue_wait", (time.perf_counter() - tq) * 1000)
+                        if limiter is not None:
+                            metrics.gauges["window"] = limiter.limit
+                    if spool is not None:
+                        return await post_compiled(
+                            transport=transport,
+                            url=args.url[0],
+                            headers=headers,
+                            rec=batch,
+                            timeout_s=args.timeout,
+                            retries=send_retries,
+                            backoff_base_s=args.backoff,
+                            limiter=limiter,
+                            idempotency_key=args.idempotency_key,
+                            rate_limit=rate_limit,
+                            metrics=metrics,
+                            codec=codec,
+                            endpoints=endpoints,
+                        )
+                    if len(batch) == 1:
+                        return [await post_one(
+                            transport=transport,
+                            url=args.url[0],
+                            headers=headers,
+                            row=batch[0],
+                            timeout_s=args.timeout,
+                            retries=send_retries,
+                            backoff_base_s=args.backoff,
+                            limiter=limiter,
+                            idempotency_key=args.idempotency_key,
+                            rate_limit=rate_limit,
+                            metrics=metrics,
+                            codec=codec,
+                            endpoints=endpoints,
+                        )]
+                    return await post_batch(
+                        transport=transport,
+                        url=args.url[0],
                         headers=headers,
-                        row=r,
+                        rows=batch,
                         timeout_s=args.timeout,
-                        retries=args.retries,
+                        retries=send_retries,
                         backoff_base_s=args.backoff,
+                        limiter=limiter,
+                        idempotency_key=args.idempotency_key,
+                        rate_limit=rate_limit,
+                        metrics=metrics,
+                        codec=codec,
+                        endpoints=endpoints,
                     )
 
-            # NOTE: for very large files, this creates many tasks at once.
-            # If you run into memory issues, tell me — I'll give the batching/queue version.
-            tasks = [asyncio.create_task(bound_call(r)) for r in rows]
-
-            for coro in asyncio.as_completed(tasks):
-                res = await coro
-                done += 1
-
-                if res.get("ok"):
-                    okc += 1
-                    sw.writerow({
-                        "ExternalMemberID": res.get("ExternalMemberID", ""),
-                        "httpStatus": res.get("httpStatus", ""),
-                        "elapsed_ms": res.get("elapsed_ms", ""),
-                        "returnedId": res.get("returnedId", ""),
-                    })
+            async def dispatch(batch, attempt: int = 0) -> None:
+                results = await bound_call(batch)
+                # one request -> every row shares the outcome, so results[0] speaks for the batch
+                transient = is_retryable(results[0])
+                if breaker is not None:
+                    breaker.record(transient)
+                if scheduler is not None and transient and attempt < args.retries:
+                    delay = args.backoff * (2 ** attempt) + random.uniform(0, 0.25)
+                    scheduler.schedule(batch, attempt + 1, max(delay, results[0].get("retryAfter") or 0))
+                    return
+                if spool is not None:
+                    # spool rows carry no fields; record() only needs them for --journal
+                    oks = [r["ok"] for r in results]
+                    if not any(oks):
+                        replay_f.write(f"{batch.offset}\n")
+                    elif not all(oks):
+                        for row_no, mid, ok in zip(batch.row_nos, batch.member_ids, oks):
+                            if not ok:
+                                partial_w.writerow([row_no, mid, batch.offset])
+                    for res in results:
+                        record(res, None)
+                    return
+                for row, res in zip(batch, results):
+                    record(res, row)
+
+            if args.deferred_retries:
+                scheduler = RetryScheduler(dispatch)
+            scheduler_task = asyncio.create_task(scheduler.run()) if scheduler is not None else None
+            lag_task = asyncio.create_task(LoopLagMonitor(metrics).run()) if args.profile else None
+
+            batches = spool.iter_records(offsets) if spool is not None else iter_batches(rows, args.batch_size)
+            if args.profile:
+                batches = cpu_timed(batches, metrics, "read")
+            try:
+                if args.stream or shard is not None or source is not None or spool is not None:
+                    await run_streaming(args, batches, dispatch, workers=max_in_flight, pending=scheduler)
                 else:
-                    failc += 1
-                    fw.writerow({
-                        "ExternalMemberID": res.get("ExternalMemberID", ""),
-                        "httpStatus": res.get("httpStatus", ""),
-                        "elapsed_ms": res.get("elapsed_ms", ""),
-                        "error": res.get("error", ""),
-                    })
-
-                # ✅ Progress print with % + elapsed + ETA
-                if done % args.print_every == 0 or done == len(rows):
-                    elapsed = time.time() - started
-                    percent = (done / len(rows)) * 100
-                    rps = done / elapsed if elapsed else 0
-
-                    remaining = len(rows) - done
-                    eta_sec = remaining / rps if rps > 0 else 0
-
-                    print(
-                        f"Progress: {done}/{len(rows)} "
-                        f"({percent:.1f}%) | "
-                        f"ok={okc} fail={failc} | "
-                        f"elapsed={elapsed/60:.1f} min | "
-                        f"ETA={eta_sec/60:.1f} min"
-                    )
+                    # NOTE: for very large files, this creates many tasks at once.
+                    # Use --stream for the bounded queue version.
+                    tasks = [asyncio.create_task(dispatch(b)) for b in batches]
 
-        total = time.time() - started
-        print("\nDONE")
-        print(f"total={len(rows)} ok={okc} fail={failc} time={total/60:.1f} min")
-        print("success file:", args.out_success)
-        print("failed file :", args.out_failed)
+                    for coro in asyncio.as_completed(tasks):
+                        await coro
+                if scheduler is not None:
+                    await scheduler.drain()
+            finally:
+                if scheduler_task is not None:
+                    scheduler_task.cancel()
+                if lag_task is not None:
+                    lag_task.cancel()
+                if journal is not None:
+                    journal.close()
+                if dw is not None:
+                    dw.close()
+                if replay_f is not None:
+                    replay_f.close()
+                    partial_f.close()
 
+    writer_pool.shutdown()
+    if spool is not None:
+        spool.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    if args.profile:
+        metrics.add_cpu("loop_thread", time.thread_time() - cpu0)
+        metrics.add_cpu("process", time.process_time() - proc0)
+        metrics.add_cpu("wall", time.time() - wall0)
+        metrics.add_cpu("runs", 1)  # shard count once merged
 
-def main():
+    if shard is not None:
+        # final counts for the parent, sent once the shard outputs are flushed
+        if metrics is not None:
+            shard["queue"].put(("metrics", shard["index"], metrics.snapshot()))
+        if endpoints is not None:
+            shard["queue"].put(("endpoints", shard["index"], endpoints.snapshot()))
+        shard["queue"].put(("progress", shard["index"], (done + skipped + dupc, okc, failc, skipped, dupc)))
+        return
+
+    total_time = time.time() - started
+    print("\nDONE")
+    print(f"total={done} ok={okc} fail={failc} skipped={skipped} dup={dupc} time={total_time/60:.1f} min")
+    print("success file:", args.out_success)
+    print("failed file :", args.out_failed)
+    if dw is not None:
+        print("dup file    :", args.out_duplicates)
+    if spool is not None:
+        print("replay file :", args.out_replay or args.out_failed + ".offsets")
+        print("partial file:", (args.out_replay or args.out_failed + ".offsets") + ".partial.csv")
+    if endpoints is not None:
+        print_endpoint_summary(endpoints)
+    if metrics is not None:
+        print_latency_summary(metrics)
+        if args.profile:
+            print_profile_summary(metrics)
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+            print("metrics file:", args.metrics_json)
+
+
+def print_profile_summary(metrics: Metrics) -> None:
+    """
+    --profile report. If loop thread CPU is near 100% of wall time the
+    event loop itself is the bottleneck and the stage split shows where it
+    goes; if it's low, the API (or --concurrency) is the limit.
+    """
+    cpu = metrics.cpu
+    loop_s, wall = cpu["loop_thread"], cpu["wall"]
+    rows = sum(metrics.results.values()) or 1
+    runs = int(cpu["runs"]) or 1
+    print(f"  profile    loop thread CPU {loop_s:.2f}s = {loop_s / wall * 100 if wall else 0:.0f}% of wall "
+          f"({wall / runs:.1f}s{f', average of {runs} shards' if runs > 1 else ''}) | "
+          f"other threads {max(cpu['process'] - loop_s, 0):.2f}s (writer, DNS)")
+    other = loop_s - sum(cpu[k] for k in Metrics.CPU_STAGES)
+    for stage, secs in [(k, cpu[k]) for k in Metrics.CPU_STAGES] + [("aiohttp+loop", max(other, 0.0))]:
+        print(f"    {stage:<13} {secs:8.3f}s {secs / loop_s * 100 if loop_s else 0:5.1f}% "
+              f"{secs / rows * 1e6:8.1f}us/row")
+
+
+def print_latency_summary(metrics: Metrics) -> None:
+    for stage, h in metrics.hist.items():
+        if h.count:
+            print(f"  {stage:<10} n={h.count} p50={h.percentile(50):.1f}ms "
+                  f"p95={h.percentile(95):.1f}ms p99={h.percentile(99):.1f}ms max={h.max_ms:.1f}ms")
+    errors = {k: v for k, v in metrics.attempts.items() if not k.startswith("http_2")}
+    if errors:
+        print("  errors    ", ", ".join(f"{k}={v}" for k, v in sorted(errors.items())))
+
+
+def print_endpoint_summary(pool: EndpointPool) -> None:
+    for e in pool.endpoints:
+        h = e.latency
+        print(f"  endpoint   {e.url} attempts={e.counts['attempts']} errors={e.counts['errors']} "
+              f"ejections={e.counts['ejections']} p50={h.percentile(50):.1f}ms p95={h.percentile(95):.1f}ms")
+
+
+async def run_streaming(args, batches: Iterable[List[Dict[str, str]]], call, workers: int,
+                        pending: Optional[RetryScheduler] = None) -> None:
+    """
+    Bounded-queue version of run_all: the lazily read input (already grouped
+    by iter_batches) is fed into an asyncio.Queue, `workers` tasks pull from
+    it and POST. Memory stays at ~queue_size batches no matter how big the
+    input is. `call` posts a batch and records its results. Batches waiting
+    in `pending` (--deferred-retries) count against the same bound, so an
+    outage stalls the reader instead of filling the retry heap. An exception
+    from `call` stops the reader and is re-raised here.
+    """
+    maxsize = args.queue_size or workers * 4
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def worker():
+        while True:
+            batch = await queue.get()
+            try:
+                if batch is None:
+                    return
+                await call(batch)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    live = set(tasks)
+
+    def reap() -> None:
+        done = [t for t in live if t.done()]
+        live.difference_update(done)
+        for t in done:
+            if not t.cancelled() and t.exception() is not None:
+                raise t.exception()
+
+    async def put(item) -> None:
+        # A worker only returns on None, so one that ends before that has raised
+        # (e.g. a sink or journal error in `call`). With every worker dead a plain
+        # queue.put would block forever, so the put is awaited with the workers.
+        reap()
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        put_task = asyncio.ensure_future(queue.put(item))
+        try:
+            while not put_task.done():
+                await asyncio.wait([put_task, *live], return_when=asyncio.FIRST_COMPLETED)
+                reap()
+        finally:
+            put_task.cancel()
+
+    try:
+        for batch in batches:
+            # pending retries always finish or reschedule eventually, so this can't hang
+            while pending is not None and len(pending) and len(pending) + queue.qsize() >= maxsize:
+                await pending.wait_progress()
+                pending.raise_errors()
+            await put(batch)  # blocks while the queue is full
+        for _ in tasks:
+            await put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+def split_evenly(total: int, n: int) -> List[int]:
+    """total split into n near-equal parts (n <= total, see parse_args), so they sum to total."""
+    return [total // n + (1 if i < total % n else 0) for i in range(n)]
+
+
+def merge_outputs(final_path: str, parts: List[str], fmt: str, append: bool) -> None:
+    """Concatenate shard outputs in shard order (keeps a single header for csv)."""
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(p) for p in parts if os.path.exists(p)]
+        pq.write_table(pa.concat_tables(tables), final_path)
+    else:
+        with open(final_path, "ab" if append else "wb") as out:
+            for p in parts:
+                if not os.path.exists(p):
+                    continue
+                with open(p, "rb") as f:
+                    if fmt == "csv":
+                        header = f.readline()
+                        if out.tell() == 0:
+                            out.write(header)
+                    shutil.copyfileobj(f, out, 1 << 20)
+    for p in parts:
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def _shard_main(args, shard: Dict[str, Any]) -> None:
+    profiled_run(args.profile_out and f"{args.profile_out}.shard{shard['index']}", run_all, args, shard)
+
+
+def profiled_run(profile_out: Optional[str], fn, *args) -> None:
+    """asyncio.run(fn(*args)), under cProfile when profile_out is set (pstats dumped even on error)."""
+    if not profile_out:
+        asyncio.run(fn(*args))
+        return
+    import cProfile
+
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        asyncio.run(fn(*args))
+    finally:
+        prof.disable()
+        prof.dump_stats(profile_out)
+        print("profile dump:", profile_out)
+
+
+def run_sharded(args) -> None:
+    """
+    --workers N: one process per record-aligned byte range of the input,
+    each with its own event loop, connector and share of --concurrency.
+    The parent only aggregates progress and merges the shard outputs in
+    shard order once all children are done.
+    """
+    fieldnames, shards = plan_shards(args.input, args.workers)
+    total = sum(sh["rows"] for sh in shards)
+    if not total:
+        print("No rows found in input CSV.")
+        return
+
+    n = len(shards)
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    concurrency = split_evenly(args.concurrency, n)
+    max_concurrency = split_evenly(args.max_concurrency or args.concurrency * 4, n)
+
+    procs = []
+    for i, sh in enumerate(shards):
+        child = argparse.Namespace(**vars(args))
+        child.workers = 1
+        child.concurrency = concurrency[i]
+        child.max_concurrency = max_concurrency[i]
+        # the quota is global: each shard gets its share of rate and burst
+        child.max_rps = args.max_rps / n
+        child.burst = max(1, (args.burst or math.ceil(args.max_rps)) // n)
+        child.out_success = f"{args.out_success}.shard{i}"
+        child.out_failed = f"{args.out_failed}.shard{i}"
+        shard = dict(sh, index=i, fieldnames=fieldnames, queue=queue)
+        proc = ctx.Process(target=_shard_main, args=(child, shard), name=f"shard{i}")
+        proc.start()
+        procs.append(proc)
+
+    started = time.time()
+    stats = [(0, 0, 0, 0, 0)] * n
+    merged_metrics = Metrics()
+    merged_endpoints = EndpointPool(args.url) if len(args.url) > 1 else None
+    next_print = min(args.print_every, total)
+    while any(p.is_alive() for p in procs) or not queue.empty():
+        try:
+            kind, idx, payload = queue.get(timeout=0.5)
+        except Exception:
+            continue
+        if kind == "metrics":
+            merged_metrics.merge(payload)
+            continue
+        if kind == "endpoints":
+            merged_endpoints.merge(payload)
+            continue
+        stats[idx] = payload
+        seen, okc, failc, skipped, dupc = (sum(col) for col in zip(*stats))
+        if seen >= next_print:
+            # always print the final 100% line, once
+            next_print = min((seen // args.print_every + 1) * args.print_every, total)
+            if seen >= total:
+                next_print = total + 1
+            elapsed = time.time() - started
+            rps = (seen - skipped - dupc) / elapsed if elapsed else 0
+            eta_sec = max(total - seen, 0) / rps if rps > 0 else 0
+            print(
+                f"Progress: {seen}/{total} "
+                f"({min(seen / total, 1.0) * 100:.1f}%) | "
+                f"ok={okc} fail={failc}"
+                + (f" skipped={skipped}" if skipped else "")
+                + (f" dup={dupc}" if dupc else "")
+                + f" | workers={sum(p.is_alive() for p in procs)}/{n} | "
+                f"elapsed={elapsed/60:.1f} min | "
+                f"ETA={eta_sec/60:.1f} min"
+            )
+    for p in procs:
+        p.join()
+
+    failed_shards = [p.name for p in procs if p.exitcode != 0]
+    merge_outputs(args.out_success, [f"{args.out_success}.shard{i}" for i in range(n)], args.out_format, args.resume)
+    merge_outputs(args.out_failed, [f"{args.out_failed}.shard{i}" for i in range(n)], args.out_format, args.resume)
+
+    seen, okc, failc, skipped, dupc = (sum(col) for col in zip(*stats))
+    total_time = time.time() - started
+    print("\nDONE")
+    print(f"total={seen - skipped - dupc} ok={okc} fail={failc} skipped={skipped} dup={dupc} "
+          f"workers={n} time={total_time/60:.1f} min")
+    print("success file:", args.out_success)
+    print("failed file :", args.out_failed)
+    if merged_endpoints is not None:
+        print_endpoint_summary(merged_endpoints)
+    if args.metrics_port or args.metrics_json or args.profile:
+        print_latency_summary(merged_metrics)
+        if args.profile:
+            print_profile_summary(merged_metrics)
+        if args.metrics_json:
+            merged_metrics.write_json(args.metrics_json)
+            print("metrics file:", args.metrics_json)
+    if failed_shards:
+        raise SystemExit(f"shard process(es) failed: {', '.join(failed_shards)}")
+
+
+def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Read CSV and POST concurrently (with progress + ETA)")
-    p.add_argument("--input", required=True, help="Input CSV path")
-    p.add_argument("--url", required=True, help="API URL")
+    p.add_argument("--input", default=None, help="Input CSV path (not needed with --spool)")
+    p.add_argument("--url", nargs="+", default=None, metavar="URL",
+                   help="API URL (not needed with --compile-spool); several (space or comma separated) "
+                        "are load-balanced with passive health checks")
+    p.add_argument("--transport", choices=TRANSPORTS, default="aiohttp",
+                   help="HTTP client: aiohttp (HTTP/1.1 keep-alive pool) or http2 (httpx, streams multiplexed "
+                        "over one connection; h2c prior knowledge for http:// URLs)")
+    p.add_argument("--warm-up", type=int, default=0, metavar="N",
+                   help="Open N connections per endpoint before the first row by GETting --warm-up-url, "
+                        "outside --max-rps (default: 0 = off)")
+    p.add_argument("--warm-up-url", default=None, metavar="URL",
+                   help="Cheap GET target for --warm-up, e.g. /health (a path is resolved against each --url)")
+    p.add_argument("--dns-ttl", type=int, default=300, help="Seconds DNS answers are cached (aiohttp)")
+    p.add_argument("--keepalive", type=float, default=60.0, help="Seconds an idle connection is kept for reuse")
+    p.add_argument("--limit-per-host", type=int, default=0,
+                   help="Connections per host under the pool limit (aiohttp; 0 = only the pool limit)")
+    p.add_argument("--lb", choices=EndpointPool.POLICIES, default="least-outstanding",
+                   help="Endpoint choice with several --url: fewest in flight, or in flight weighted by latency")
+    p.add_argument("--eject-after", type=int, default=3,
+                   help="Consecutive 5xx/timeouts/connection errors that take an endpoint out of rotation")
+    p.add_argument("--eject-seconds", type=float, default=10.0,
+                   help="How long an ejected endpoint stays out (doubles on repeat ejections, max 120s)")
     p.add_argument("--token", default=None, help="Bearer token (optional)")
     p.add_argument("--concurrency", type=int, default=5, help="Concurrent requests")
     p.add_argument("--timeout", type=int, default=120, help="Timeout per request (seconds)")
@@ -263,9 +2455,123 @@ def main():
     p.add_argument("--out-failed", default="failed.csv", help="Failed output CSV")
     p.add_argument("--verify-false", action="store_true", help="Disable SSL verification (TEST ONLY)")
     p.add_argument("--print-every", type=int, default=25, help="Print progress every N records")
-    args = p.parse_args()
+    p.add_argument("--stream", action="store_true",
+                   help="Stream rows through a bounded queue instead of loading the whole CSV")
+    p.add_argument("--queue-size", type=int, default=0,
+                   help="Max queued rows in --stream mode (default: 4 x concurrency)")
+    p.add_argument("--batch-size", type=int, default=1,
+                   help="Send up to N rows sharing a VisibleID in one request (1 = one row per request)")
+    p.add_argument("--adaptive", action="store_true",
+                   help="AIMD concurrency: --concurrency is the starting window, grows/shrinks with latency and 429/503")
+    p.add_argument("--min-concurrency", type=int, default=1, help="Lower bound for --adaptive window")
+    p.add_argument("--max-concurrency", type=int, default=0,
+                   help="Upper bound for --adaptive window (default: 4 x concurrency)")
+    p.add_argument("--target-p95-ms", type=float, default=1000, help="--adaptive grows only while p95 stays under this")
+    p.add_argument("--target-p50-ms", type=float, default=0, help="Optional p50 target for --adaptive (0 = off)")
+    p.add_argument("--journal", default=None,
+                   help="SQLite checkpoint journal recording succeeded rows (enables --resume)")
+    p.add_argument("--resume", action="store_true",
+                   help="Skip rows the --journal says already succeeded; append to existing outputs")
+    p.add_argument("--dedup", choices=["off", "exact", "bloom"], default="off",
+                   help="Skip rows whose payload was already sent this run (not with --workers). bloom = bounded memory, but a false "
+                        "positive (--dedup-fp-rate) skips a unique note without sending it; those rows are "
+                        "listed with match=probable in --out-duplicates")
+    p.add_argument("--dedup-capacity", type=int, default=0,
+                   help="Expected rows for --dedup bloom sizing (default: input line count)")
+    p.add_argument("--dedup-fp-rate", type=float, default=1e-6, help="False-positive rate for --dedup bloom")
+    p.add_argument("--out-duplicates", default="duplicates.csv", help="Rows skipped by --dedup")
+    p.add_argument("--idempotency-key", action="store_true",
+                   help="Send an Idempotency-Key header derived from the payload hash")
+    p.add_argument("--out-format", choices=["csv", "jsonl", "parquet"], default="csv",
+                   help="Format of success/failed/duplicates outputs (parquet needs pyarrow)")
+    p.add_argument("--flush-rows", type=int, default=1000,
+                   help="Buffer this many results per output before writing (off the event loop)")
+    p.add_argument("--max-rps", type=float, default=0,
+                   help="Cap requests per second, retries included (0 = no cap)")
+    p.add_argument("--burst", type=int, default=0,
+                   help="Token bucket size for --max-rps (default: one second worth of requests)")
+    p.add_argument("--metrics-port", type=int, default=0,
+                   help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics during the run (--workers: PORT+shard)")
+    p.add_argument("--metrics-json", default=None,
+                   help="Write latency percentiles per stage + error breakdown here at the end")
+    p.add_argument("--json-codec", choices=["auto", "orjson", "msgspec", "json"], default="auto",
+                   help="JSON encoder/decoder for requests and responses (auto: orjson > msgspec > json)")
+    p.add_argument("--deferred-retries", action="store_true",
+                   help="Retry transient failures from a time-ordered scheduler instead of sleeping inside the concurrency slot")
+    p.add_argument("--breaker-threshold", type=float, default=0,
+                   help="Pause dispatch when this share of recent requests fail transiently (e.g. 0.5; 0 = off)")
+    p.add_argument("--breaker-window", type=int, default=100, help="Requests considered by --breaker-threshold")
+    p.add_argument("--breaker-cooldown", type=float, default=5.0, help="Seconds dispatch stays paused once tripped")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Split the input across N processes (each streams its own byte range)")
+    p.add_argument("--profile", action="store_true",
+                   help="Sample event-loop lag and split event-loop CPU by stage (read/build/decode/record); printed at the end")
+    p.add_argument("--profile-out", default=None, metavar="PATH",
+                   help="Also run under cProfile and dump pstats here (--workers: PATH.shard<i>); "
+                        "view with snakeviz or flameprof")
+    p.add_argument("--compile-spool", default=None, metavar="PATH",
+                   help="Validate --input once and write the encoded request bodies (per --batch-size) to PATH, then exit")
+    p.add_argument("--spool", default=None, metavar="PATH",
+                   help="Send the requests of a compiled spool instead of reading --input")
+    p.add_argument("--spool-offsets", default=None, metavar="FILE",
+                   help="With --spool: only send these records (one offset per line, e.g. a previous --out-replay)")
+    p.add_argument("--out-replay", default=None,
+                   help="With --spool: offsets of records whose rows all failed (default: <out-failed>.offsets); "
+                        "failed rows of partly successful batches go to <out-replay>.partial.csv by row number")
+    return p
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = build_parser()
+    args = p.parse_args(argv)
+    if args.resume and not args.journal:
+        p.error("--resume needs --journal")
+    if args.resume and args.out_format == "parquet":
+        p.error("--resume appends to outputs, which parquet doesn't support")
+    if args.compile_spool and args.journal and not args.resume:
+        # the journal is only written when sending; compiling can only read it
+        p.error("--compile-spool uses --journal only with --resume")
+    if args.spool:
+        # batching, dedup and resume are applied by --compile-spool / via --spool-offsets
+        for flag, on in (("--journal", args.journal), ("--dedup", args.dedup != "off"),
+                         ("--workers", args.workers > 1), ("--batch-size", args.batch_size > 1)):
+            if on:
+                p.error(f"{flag} doesn't apply to --spool")
+    elif args.spool_offsets:
+        p.error("--spool-offsets needs --spool")
+    elif not args.input:
+        p.error("--input is required (or --spool)")
+    if args.workers > 1:
+        if args.dedup != "off":
+            # shards only see their own byte range, so a duplicate in another shard would be sent
+            p.error("--dedup doesn't work with --workers (duplicates across shards would be sent)")
+        # every shard needs at least one slot and one token, so more shards than
+        # that would exceed the global limits they split
+        if args.workers > args.concurrency:
+            p.error(f"--workers {args.workers} is more than --concurrency {args.concurrency}")
+        if args.max_concurrency and args.workers > args.max_concurrency:
+            p.error(f"--workers {args.workers} is more than --max-concurrency {args.max_concurrency}")
+        burst = args.burst or math.ceil(args.max_rps)
+        if args.max_rps and args.workers > burst:
+            p.error(f"--workers {args.workers} is more than the --max-rps burst ({burst}); raise --burst")
+    args.url = [u.strip() for v in args.url or [] for u in v.split(",") if u.strip()]
+    if args.warm_up > 0 and not args.warm_up_url:
+        # never probe the notes URL itself: it only takes POSTs
+        p.error("--warm-up needs --warm-up-url")
+    if not args.url and not args.compile_spool:
+        p.error("--url is required")
+    return args
+
+
+def main():
+    args = parse_args()
 
-    asyncio.run(run_all(args))
+    if args.compile_spool:
+        compile_spool(args)
+    elif args.workers > 1:
+        run_sharded(args)
+    else:
+        profiled_run(args.profile_out, run_all, args)
 
 
 if __name__ == "__main__":
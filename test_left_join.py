@@ -0,0 +1,86 @@
+import csv
+import random
+
+import pytest
+
+from left_join import JoinSide, LeftJoin
+from medicaid_matcher import RowWriter
+
+KEYS = [f"K{i}" for i in range(400)]
+
+
+def write(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(header)
+        w.writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    rnd = random.Random(7)
+
+    def key():
+        # padding, case, blank keys and keys with no match
+        k = rnd.choice(KEYS + ["", "  ", "NOPE"])
+        return rnd.choice([k, f" {k} ", k.lower()])
+
+    left = write(tmp_path / "left.csv", ["id", "name"],
+                 [[key(), f"n{i}"] if i % 97 else ["", ""] for i in range(3000)])
+    # duplicate keys in both lookups: the first row must win
+    join1 = write(tmp_path / "join1.csv", ["key", "a", "b"], [[key(), f"a{i}", f"b{i}"] for i in range(600)])
+    join2 = write(tmp_path / "join2.csv", ["c", "key"], [[f"c{i}", key()] for i in range(900)])
+    return tmp_path, left, join1, join2
+
+
+def run_join(tmp_path, left, join1, join2, memory_rows, name, ignore_case=False):
+    key_fn = (lambda v: v.strip().upper()) if ignore_case else str.strip
+    engine = LeftJoin(JoinSide([left, "id"], default_all=True),
+                      [JoinSide([join1, "0"], default_all=False), JoinSide([join2, "key", "c"], default_all=False)],
+                      key_fn, memory_rows, partitions=5, tmpdir=str(tmp_path))
+    out = str(tmp_path / f"{name}.csv")
+    writer = RowWriter(out, engine.header(), "JoinedData")
+    try:
+        stats = engine.run(writer)
+    finally:
+        writer.close()
+    with open(out, "rb") as f:
+        return engine.mode, stats, f.read()
+
+
+def distinct_keys(path, col, key_fn):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))[1:]
+    return len({key_fn(r[col]) for r in rows} - {""})
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+def test_spilled_join_matches_in_memory_join(inputs, ignore_case):
+    tmp_path, left, join1, join2 = inputs
+    key_fn = (lambda v: v.strip().upper()) if ignore_case else str.strip
+    n1 = distinct_keys(join1, 0, key_fn)
+    n2 = distinct_keys(join2, 1, key_fn)
+
+    mode, stats, expected = run_join(tmp_path, left, join1, join2, 10**9, "memory", ignore_case)
+    assert mode == "memory"
+    assert stats["left_rows"] == 3000 - len(range(0, 3000, 97))
+    assert stats["matched_1"] and stats["matched_2"]
+
+    # spill partway through the first input, right after it, and partway through the second
+    for memory_rows in (0, n1 // 2, n1, n1 + n2 // 3, n1 + n2 - 1):
+        mode, spilled_stats, got = run_join(tmp_path, left, join1, join2, memory_rows, f"spill{memory_rows}",
+                                            ignore_case)
+        assert mode == "spill"
+        assert got == expected
+        assert spilled_stats == stats
+
+
+def test_join_first_match_wins(tmp_path):
+    left = write(tmp_path / "left.csv", ["id"], [["A"], ["B"], [" A "], ["C"]])
+    join1 = write(tmp_path / "join1.csv", ["key", "v"], [["A", "1"], ["B", "2"], ["A", "3"], [" B", "4"]])
+    join2 = write(tmp_path / "join2.csv", ["c", "key"], [["x", "C"], ["y", "A"], ["z", "C"]])
+
+    outputs = {run_join(tmp_path, left, join1, join2, m, f"out{m}")[2] for m in (10**9, 0, 1, 2, 3)}
+
+    assert outputs == {b"id,v,c\r\nA,1,y\r\nB,2,\r\n A ,1,y\r\nC,,x\r\n"}
@@ -0,0 +1,43 @@
+import pytest
+
+from normalize_pipeline import default_mask, load_hook
+
+KEY = b"test-key"
+
+
+def is_token(v):
+    return isinstance(v, str) and v.startswith("tok_") and len(v) == 20
+
+
+@pytest.mark.parametrize("column", ["ssn", "email", "member_id", "MemberID", "patient_dob"])
+def test_default_mask_sensitive_column(column):
+    masked = default_mask(column, "123-45-6789", KEY)
+
+    assert is_token(masked)
+    assert masked == default_mask(column, "123-45-6789", KEY)
+    assert masked != default_mask(column, "123-45-6789", b"other-key")
+
+
+def test_default_mask_sensitive_column_nested_value():
+    masked = default_mask("address", {"line": "1 Main St", "zip": 12345, "tags": ["home"]}, KEY)
+
+    assert set(masked) == {"line", "zip", "tags"}
+    assert is_token(masked["line"]) and is_token(masked["zip"]) and is_token(masked["tags"][0])
+
+
+def test_default_mask_sensitive_keys_only():
+    obj = {"note": "ok", "Email": ["a@x", "b@x"], "contact": {"phone": {"home": "555"}}, "items": [{"ssn": 1}]}
+
+    masked = default_mask("payload", obj, KEY)
+
+    assert masked["note"] == "ok"
+    assert all(is_token(v) for v in masked["Email"])
+    assert is_token(masked["contact"]["phone"]["home"])
+    assert is_token(masked["items"][0]["ssn"])
+    assert default_mask("payload", "123-45-6789", KEY) == "123-45-6789"
+
+
+def test_default_hook_needs_key():
+    with pytest.raises(SystemExit):
+        load_hook("default", b"")
+    assert is_token(load_hook("default", KEY)("ssn", "1"))
@@ -0,0 +1,498 @@
+import asyncio
+import csv
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from sample_test import (
+    ROW_NO, CheckpointJournal, CircuitBreaker, EndpointPool, RetryScheduler, Spool, SpoolWriter, number_rows, plan_shards, read_rows,
+    parse_args, run_streaming, split_evenly,
+)
+
+
+def make_rows(n):
+    return list(number_rows(
+        {"ExternalMemberID": f"M{i}", "VisibleID": f"V{i}", "NoteText": f"note {i}"} for i in range(n)
+    ))
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = CheckpointJournal(str(tmp_path / "journal.sqlite"), commit_every=3)
+    yield j
+    j.close()
+
+
+def ok(row):
+    return {"ok": True, "ExternalMemberID": row["ExternalMemberID"], "returnedId": "r"}
+
+
+def test_skip_done_skips_journaled_rows(journal):
+    rows = make_rows(20)
+    for r in rows[::2]:
+        journal.add(r, ok(r))
+    journal.add(rows[1], {"ok": False, "ExternalMemberID": "M1"})
+    journal.flush()
+
+    skipped = []
+    left = list(journal.skip_done(make_rows(20), skipped.append))
+
+    assert [r[ROW_NO] for r in left] == list(range(1, 20, 2))
+    assert [r[ROW_NO] for r in skipped] == list(range(0, 20, 2))
+
+
+def test_skip_done_resends_edited_rows(journal):
+    rows = make_rows(3)
+    for r in rows:
+        journal.add(r, ok(r))
+    journal.flush()
+
+    again = make_rows(3)
+    again[1]["NoteText"] = "edited"
+    again[2]["ExternalMemberID"] = "M99"
+    left = list(journal.skip_done(again, lambda r: None))
+
+    assert [r[ROW_NO] for r in left] == [1, 2]
+
+
+def test_skip_done_across_chunks(journal):
+    rows = make_rows(50)
+    done = {0, 1, 2, 7, 8, 30, 31, 32, 33, 49}
+    for r in rows:
+        if r[ROW_NO] in done:
+            journal.add(r, ok(r))
+    journal.flush()
+
+    # a shard starts mid-file and the journal is read 2 keys at a time
+    shard = make_rows(50)[5:]
+    left = list(journal.skip_done(shard, lambda r: None, chunk=2))
+
+    assert [r[ROW_NO] for r in left] == [n for n in range(5, 50) if n not in done]
+
+
+def test_skip_done_empty_journal(journal):
+    assert len(list(journal.skip_done(make_rows(5), lambda r: None))) == 5
+
+
+def write_csv(path, rows, trailing_newline=True):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["ExternalMemberID", "VisibleID", "NoteText"])
+        w.writeheader()
+        w.writerows(rows)
+    if not trailing_newline:
+        with open(path, "rb+") as f:
+            f.seek(-2, 2)
+            f.truncate()
+
+
+def tricky_rows(n):
+    # quoted newlines, quotes (written as "" escapes) and a quote right before a newline
+    texts = ['plain', 'two\nlines', 'say ""hi""\nthen', '"\n"', 'a,b\n\n', 'end"']
+    return [{"ExternalMemberID": f"M{i}", "VisibleID": f"V{i}", "NoteText": texts[i % len(texts)] * (i % 4 + 1)}
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 64])
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_plan_shards_cover_input_on_record_boundaries(tmp_path, n, trailing_newline):
+    path = str(tmp_path / "in.csv")
+    rows = tricky_rows(200)
+    write_csv(path, rows, trailing_newline)
+
+    fieldnames, shards = plan_shards(path, n)
+
+    assert fieldnames == ["ExternalMemberID", "VisibleID", "NoteText"]
+    assert 1 <= len(shards) <= n
+    assert shards[0]["first_row"] == 0
+    for a, b in zip(shards, shards[1:]):
+        assert a["end"] == b["start"]
+        assert a["first_row"] + a["rows"] == b["first_row"]
+    assert sum(sh["rows"] for sh in shards) == len(rows)
+
+    got = []
+    for sh in shards:
+        part = list(read_rows(path, sh["start"], sh["end"], fieldnames, sh["first_row"]))
+        assert len(part) == sh["rows"]
+        got.extend(part)
+    assert [r[ROW_NO] for r in got] == list(range(len(rows)))
+    assert [r["NoteText"] for r in got] == [r["NoteText"] for r in rows]
+
+
+def test_plan_shards_never_splits_inside_quotes(tmp_path):
+    path = str(tmp_path / "in.csv")
+    # one huge quoted note full of newlines: every target lands inside it
+    rows = [{"ExternalMemberID": "M0", "VisibleID": "V0", "NoteText": "x\n" * 5000},
+            {"ExternalMemberID": "M1", "VisibleID": "V1", "NoteText": "short"}]
+    write_csv(path, rows)
+
+    _, shards = plan_shards(path, 8)
+
+    assert [sh["rows"] for sh in shards] in ([2], [1, 1])
+
+
+@pytest.fixture
+def spool(tmp_path):
+    path = str(tmp_path / "notes.spool")
+    with SpoolWriter(path) as w:
+        offsets = [
+            w.add(b'{"a":1}', [(0, "M0")], bytes(range(20))),
+            w.add(b'[{"b":2},{"c":3}]', [(1, "M1"), (2, "M\u00e9")], b"\xff" * 20),
+            w.add(b"", [], b"\x00" * 20),
+        ]
+    sp = Spool(path)
+    yield sp, offsets
+    sp.close()
+
+
+def test_spool_round_trip(spool):
+    sp, offsets = spool
+
+    assert (sp.records, sp.rows) == (3, 3)
+    assert list(sp.index) == offsets
+
+    first, second, empty = sp.iter_records()
+    assert (first.offset, first.row_nos, first.member_ids) == (offsets[0], [0], ["M0"])
+    assert first.key == bytes(range(20)).hex()
+    assert bytes(first.body) == b'{"a":1}'
+    assert (second.row_nos, second.member_ids) == ([1, 2], ["M1", "M\u00e9"])
+    assert bytes(second.body) == b'[{"b":2},{"c":3}]'
+    assert (empty.row_nos, bytes(empty.body)) == ([], b"")
+
+    assert bytes(sp.record(offsets[1]).body) == bytes(second.body)
+    assert sp.count_rows(offsets[:2]) == 3
+    del first, second, empty
+
+
+def test_spool_load_offsets(spool, tmp_path):
+    sp, offsets = spool
+    replay = tmp_path / "replay.txt"
+    replay.write_text(f"{offsets[2]}\n\n{offsets[0]}\n")
+
+    assert sp.load_offsets(str(replay)) == [offsets[2], offsets[0]]
+    assert [r.row_nos for r in sp.iter_records(sp.load_offsets(str(replay)))] == [[], [0]]
+
+
+def test_spool_load_offsets_rejects_unknown_offset(spool, tmp_path):
+    sp, offsets = spool
+    replay = tmp_path / "replay.txt"
+    replay.write_text(f"{offsets[0]}\n{offsets[1] + 1}\n")
+
+    with pytest.raises(ValueError, match="not a record offset"):
+        sp.load_offsets(str(replay))
+
+
+def test_spool_rejects_other_files(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("ExternalMemberID,VisibleID,NoteText\n" + "M0,V0,x\n" * 10)
+
+    with pytest.raises(ValueError, match="not a spool file"):
+        Spool(str(path))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    c = Clock()
+    with patch("sample_test.time.monotonic", c):
+        yield c
+
+
+def fail(pool, ep, n=1):
+    for _ in range(n):
+        assert pool.pick() is ep
+        pool.release(ep, 5.0, failed=True)
+
+
+def test_pool_least_outstanding(clock):
+    pool = EndpointPool(["http://a", "http://b"])
+    a, b = pool.endpoints
+
+    assert pool.pick() is a
+    assert pool.pick() is b
+    assert pool.pick() is a
+    pool.release(a, 10.0, failed=False)
+    pool.release(a, 10.0, failed=False)
+    pool.release(b, 50.0, failed=False)
+    # both idle: ties go to the lower latency EWMA
+    assert pool.pick() is a
+
+
+def test_pool_latency_policy(clock):
+    pool = EndpointPool(["http://a", "http://b"], policy="latency")
+    a, b = pool.endpoints
+    a.ewma_ms, b.ewma_ms = 10.0, 100.0
+    a.outstanding = 5
+
+    # (5 + 1) x 10 < (0 + 1) x 100
+    assert pool.pick() is a
+
+
+def test_pool_ejects_after_consecutive_failures(clock):
+    pool = EndpointPool(["http://a", "http://b"], eject_after=3, eject_s=10.0)
+    a, b = pool.endpoints
+    b.outstanding = 100  # keep picks on a until it is ejected
+
+    fail(pool, a, 2)
+    pool.pick()
+    pool.release(a, 5.0, failed=False)  # a success resets the streak
+    fail(pool, a, 2)
+    assert a.ejected_until == 0.0
+
+    fail(pool, a)
+    assert a.ejected_until == clock.now + 10.0
+    assert a.counts["ejections"] == 1
+    assert pool.pick() is b
+
+    clock.now += 10.0
+    assert pool.pick() is a
+
+
+def test_pool_probation_and_backoff(clock):
+    pool = EndpointPool(["http://a", "http://b"], eject_after=3, eject_s=10.0, max_eject_s=25.0)
+    a, b = pool.endpoints
+    b.outstanding = 100
+
+    fail(pool, a, 3)
+    clock.now += 10.0
+    # back on probation: one failure ejects it again, for twice as long
+    fail(pool, a)
+    assert a.ejected_until == clock.now + 20.0
+
+    clock.now += 20.0
+    fail(pool, a)
+    assert a.ejected_until == clock.now + 25.0  # capped at max_eject_s
+    assert a.counts["ejections"] == 3
+
+    clock.now += 25.0
+    pool.pick()
+    pool.release(a, 5.0, failed=False)
+    assert (a.fail_streak, a.backoff) == (0, 0)
+    fail(pool, a, 2)
+    assert a.ejected_until <= clock.now
+
+
+def test_pool_all_ejected_uses_first_due_back(clock):
+    pool = EndpointPool(["http://a", "http://b"], eject_after=1, eject_s=10.0)
+    a, b = pool.endpoints
+
+    fail(pool, a)
+    clock.now += 5.0
+    fail(pool, b)
+
+    assert pool.pick() is a
+
+
+def test_run_streaming_posts_every_batch():
+    seen = []
+
+    async def call(batch):
+        await asyncio.sleep(0)
+        seen.append(batch)
+
+    asyncio.run(run_streaming(SimpleNamespace(queue_size=2), iter(range(50)), call, workers=3))
+
+    assert sorted(seen) == list(range(50))
+
+
+@pytest.mark.parametrize("fail_on", [None, 7])
+def test_run_streaming_raises_worker_errors(fail_on):
+    # fail_on=None: every call fails, so every worker dies with the queue full
+    read = []
+
+    def batches():
+        for i in range(1000):
+            read.append(i)
+            yield i
+
+    async def call(batch):
+        await asyncio.sleep(0)
+        if fail_on is None or batch == fail_on:
+            raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        asyncio.run(asyncio.wait_for(
+            run_streaming(SimpleNamespace(queue_size=2), batches(), call, workers=3), timeout=5))
+    if fail_on is None:
+        assert len(read) < 10
+
+
+def cli(*extra):
+    return ["--input", "in.csv", "--url", "http://a/notes", *extra]
+
+
+@pytest.mark.parametrize("extra", [
+    ["--workers", "4", "--concurrency", "2"],
+    ["--workers", "4", "--concurrency", "8", "--max-concurrency", "3"],
+    ["--workers", "4", "--concurrency", "8", "--max-rps", "2.5"],
+    ["--workers", "4", "--concurrency", "8", "--max-rps", "100", "--burst", "3"],
+    ["--workers", "2", "--concurrency", "8", "--dedup", "exact"],
+])
+def test_parse_args_rejects_invalid_workers(extra):
+    with pytest.raises(SystemExit):
+        parse_args(cli(*extra))
+
+
+def test_shard_limits_sum_to_global_limits():
+    args = parse_args(cli("--workers", "4", "--concurrency", "6", "--max-rps", "4"))
+
+    assert split_evenly(args.concurrency, args.workers) == [2, 2, 1, 1]
+    assert split_evenly(4, 4) == [1, 1, 1, 1]
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_retry_scheduler_dispatches_in_due_order(clock):
+    # the event loop reads the same patched clock, so run()'s timeouts only fire once it is advanced
+    dispatched = []
+
+    async def dispatch(batch, attempt):
+        dispatched.append((batch, attempt))
+
+    async def go():
+        sched = RetryScheduler(dispatch)
+        runner = asyncio.create_task(sched.run())
+        try:
+            sched.schedule(["c"], 1, 3.0)
+            sched.schedule(["a"], 2, 1.0)
+            sched.schedule(["d"], 1, 3.0)
+            sched.schedule(["b"], 1, 1.0)
+            await settle()
+            assert dispatched == [] and len(sched) == 4
+
+            clock.now += 1.0
+            await settle()
+            assert dispatched == [(["a"], 2), (["b"], 1)]
+            assert len(sched) == 2
+
+            # a retry scheduled later but due sooner goes first
+            sched.schedule(["e"], 1, 0.5)
+            clock.now += 0.5
+            await settle()
+            assert dispatched[2:] == [(["e"], 1)]
+
+            clock.now += 10.0
+            await settle()
+            # equal due times keep scheduling order
+            assert dispatched[3:] == [(["c"], 1), (["d"], 1)]
+            assert len(sched) == 0
+        finally:
+            runner.cancel()
+
+    asyncio.run(go())
+
+
+def test_retry_scheduler_reschedule_and_drain():
+    attempts = []
+
+    async def go():
+        async def dispatch(batch, attempt):
+            attempts.append((batch[0], attempt))
+            await asyncio.sleep(0.001)
+            if attempt < 3:
+                sched.schedule(batch, attempt + 1, 0.002)
+
+        sched = RetryScheduler(dispatch)
+        runner = asyncio.create_task(sched.run())
+        try:
+            sched.schedule(["x"], 1, 0.0)
+            sched.schedule(["y"], 3, 0.001)
+            await asyncio.wait_for(sched.drain(), 5)
+            assert len(sched) == 0
+        finally:
+            runner.cancel()
+
+    asyncio.run(go())
+
+    assert sorted(attempts) == [("x", 1), ("x", 2), ("x", 3), ("y", 3)]
+
+
+def test_retry_scheduler_surfaces_dispatch_errors():
+    async def go():
+        async def dispatch(batch, attempt):
+            if batch == ["bad"]:
+                raise OSError("sink failed")
+
+        sched = RetryScheduler(dispatch)
+        runner = asyncio.create_task(sched.run())
+        try:
+            sched.schedule(["ok"], 1, 0.0)
+            sched.schedule(["bad"], 1, 0.0)
+            await asyncio.wait_for(sched.wait_progress(), 5)
+            await settle()
+            with pytest.raises(OSError, match="sink failed"):
+                sched.raise_errors()
+            with pytest.raises(OSError, match="sink failed"):
+                await asyncio.wait_for(sched.drain(), 5)
+        finally:
+            runner.cancel()
+
+    asyncio.run(go())
+
+
+def test_breaker_needs_min_samples(clock):
+    br = CircuitBreaker(threshold=0.5, window=10, cooldown_s=5.0, min_samples=4)
+
+    for _ in range(3):
+        br.record(True)
+    assert not br.is_open
+
+    br.record(False)  # 3 of 4 failed
+    assert br.is_open and br.trips == 1
+
+
+def test_breaker_window_slides(clock):
+    br = CircuitBreaker(threshold=0.75, window=4, min_samples=4)
+
+    for error in (False,) * 6 + (True, True):
+        br.record(error)
+        assert not br.is_open
+    br.record(True)  # 3 of 9 overall, but 3 of the last 4
+    assert br.is_open
+
+
+def test_breaker_cooldown_and_half_open(clock):
+    br = CircuitBreaker(threshold=0.5, window=10, cooldown_s=5.0, min_samples=4)
+    for _ in range(4):
+        br.record(True)
+    assert br.is_open
+
+    # failures while open (in-flight requests finishing) neither extend nor re-trip it
+    br.record(True)
+    clock.now += 4.9
+    assert br.is_open
+    clock.now += 0.1
+    assert not br.is_open and br.trips == 1
+
+    # half-open: a fresh window, so it takes min_samples new outcomes to trip again
+    br.record(True)
+    br.record(True)
+    assert not br.is_open
+    br.record(False)
+    br.record(False)
+    assert br.is_open and br.trips == 2
+
+
+def test_breaker_wait_closed(clock):
+    br = CircuitBreaker(threshold=0.5, window=10, cooldown_s=5.0, min_samples=1)
+    br.record(True)
+
+    async def go():
+        waiter = asyncio.create_task(br.wait_closed())
+        await settle()
+        assert not waiter.done()
+        clock.now += 5.0
+        await settle()
+        assert waiter.done()
+
+    asyncio.run(go())